@@ -1,35 +1,135 @@
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, session
-import pandas as pd
-import requests
+from flask import Flask, Blueprint, render_template, request, jsonify, send_file, redirect, url_for, session, Response
 from datetime import datetime
 import time
 import json
+import re
 from urllib.parse import quote
-import io
 from werkzeug.utils import secure_filename
 import logging
-import codecs
 from math import ceil
 from datetime import timedelta
 import tempfile
 import os
 import uuid
-import atexit
+import threading
+import random
+import bisect
+import contextvars
+from collections import Counter, OrderedDict, deque
+from functools import lru_cache
+from contextlib import contextmanager
+import csv
+import fcntl
+import sqlite3
+import gzip
+import hashlib
+import importlib
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self.name), attr)
+
+# The dataframe, spreadsheet and HTTP stacks are most of the import time,
+# so they load on first use rather than on every worker boot
+pd = LazyModule('pandas')
+np = LazyModule('numpy')
+openpyxl = LazyModule('openpyxl')
+requests = LazyModule('requests')
+
+# Settings below are read from the environment at import, so .env comes first
 load_dotenv()
-app = Flask(__name__)
-app.secret_key = 'your-secret-key-here'
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=1)
+bp = Blueprint('roambee', __name__)
 
 # Configuration
 API_KEY = os.getenv("API_KEY")
 #print(API_KEY)
+# Optional comma-separated key pool; calls are spread over every key
+API_KEYS = [key.strip() for key in os.getenv("API_KEYS", "").split(",") if key.strip()] or [API_KEY]
+# AdaptiveController.call adds the apikey header of the key it picks
+STATUS_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept": "application/json"
+}
 BATCH_SIZE = 200
 REQUEST_RATE = 4
-DELAY_BETWEEN_BATCHES = 1 / REQUEST_RATE
-STATUS_BASE_URL = "https://view.roambee.com/services/v2/autocrud/bee_commands"
-SEND_URL = "https://view.roambee.com/services/command/send_commands"
+# Adaptive (AIMD) bounds for batch size and request rate, per endpoint
+MIN_BATCH_SIZE = int(os.getenv("MIN_BATCH_SIZE", 50))
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 1000))
+BATCH_INCREASE_STEP = 20
+MIN_REQUEST_RATE = float(os.getenv("MIN_REQUEST_RATE", 0.5))
+MAX_REQUEST_RATE = float(os.getenv("MAX_REQUEST_RATE", 20))
+RATE_INCREASE_STEP = 0.25
+SLOW_RESPONSE_SECONDS = float(os.getenv("SLOW_RESPONSE_SECONDS", 5))
+DECREASE_COOLDOWN = 1.0
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", 3))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+# Each key's quota can only be used with enough batches in flight to fill it
+MAX_CONCURRENT_BATCHES = int(os.getenv("MAX_CONCURRENT_BATCHES", 4 * len(API_KEYS)))
+# Circuit breaker: trip on the error rate over the last BREAKER_WINDOW calls
+# or on consecutive timeouts, then probe with a backoff until the API answers
+BREAKER_WINDOW = 20
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 10))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", 0.5))
+BREAKER_CONSECUTIVE_TIMEOUTS = int(os.getenv("BREAKER_CONSECUTIVE_TIMEOUTS", 3))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", 10))
+BREAKER_MAX_OPEN_SECONDS = 300
+BREAKER_HALF_OPEN_SUCCESSES = 3
+# A throttled (429) key is passed over for this long, doubling while it stays throttled
+KEY_THROTTLE_SECONDS = float(os.getenv("KEY_THROTTLE_SECONDS", 30))
+KEY_MAX_THROTTLE_SECONDS = 600
+JOB_EVENT_INTERVAL = 0.5
+# Each event stream ends after this long and the client reconnects, so a
+# watcher never holds a sync worker for the length of a job
+JOB_EVENT_MAX_SECONDS = 10
+JOB_STALE_SECONDS = 300
+STATUS_PAGE_SIZE = 500
+# Common API gateway limit on request line length
+MAX_STATUS_URL_LENGTH = int(os.getenv("MAX_STATUS_URL_LENGTH", 8000))
+STATUS_SHARD_SECONDS = int(os.getenv("STATUS_SHARD_SECONDS", 7 * 24 * 3600))
+# Kept outside TEMP_UPLOAD_DIR so upload cleanup does not wipe it; set empty to disable
+COMMAND_INDEX_PATH = os.getenv("COMMAND_INDEX_PATH",
+                               os.path.join(tempfile.gettempdir(), 'roambee_command_index.sqlite3'))
+INDEX_SYNC_SKEW_SECONDS = 120
+# The sweeper drops indexed IMEIs not synced for this long, then the least
+# recently synced ones while the index's live pages exceed the size budget
+COMMAND_INDEX_TTL_SECONDS = int(os.getenv("COMMAND_INDEX_TTL_SECONDS", 7 * 24 * 3600))
+COMMAND_INDEX_MAX_BYTES = int(os.getenv("COMMAND_INDEX_MAX_BYTES", 1024 ** 3))
+INDEX_PRUNE_CHUNK = 500
+# Watch mode: first re-poll interval, its growth per round, and the limits
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", 30))
+WATCH_BACKOFF = 1.5
+WATCH_MAX_INTERVAL = float(os.getenv("WATCH_MAX_INTERVAL", 600))
+WATCH_TIMEOUT = float(os.getenv("WATCH_TIMEOUT", 3600))
+WATCH_MAX_TIMEOUT = float(os.getenv("WATCH_MAX_TIMEOUT", 24 * 3600))
+WATCH_HEARTBEAT = 30
+# Seconds between a batch's send and the first lookup of its command ids
+VERIFY_DELAY = float(os.getenv("VERIFY_DELAY", 10))
+VERIFY_TIMEOUT = float(os.getenv("VERIFY_TIMEOUT", 900))
+# Rate limits shared by every gunicorn worker on the host; set empty for per-process limits
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH",
+                               os.path.join(tempfile.gettempdir(), 'roambee_rate_limits.sqlite3'))
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", 2 * MAX_CONCURRENT_BATCHES))
+RATE_SHARE_STALE_SECONDS = 60
+STATUS_BASE_URL = os.getenv("STATUS_BASE_URL", "https://view.roambee.com/services/v2/autocrud/bee_commands")
+SEND_URL = os.getenv("SEND_URL", "https://view.roambee.com/services/command/send_commands")
 ALLOWED_EXTENSIONS = {'xlsx', 'xls', 'csv'}
+IMEI_CHUNK_ROWS = 50000
+IMEI_LUHN_CHECK = os.getenv("IMEI_LUHN_CHECK", "false").lower() == "true"
+IMEI_CACHE_SIZE = int(os.getenv("IMEI_CACHE_SIZE", 8))
+REPORT_FORMATS = {
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('csv', 'text/csv'),
+    'csv.gz': ('csv.gz', 'application/gzip'),
+    'ndjson': ('ndjson', 'application/x-ndjson')
+}
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -37,53 +137,810 @@ logger = logging.getLogger(__name__)
 
 # Configure temporary storage
 TEMP_UPLOAD_DIR = os.path.join(tempfile.gettempdir(), 'roambee_uploads')
-os.makedirs(TEMP_UPLOAD_DIR, exist_ok=True)
+# Send journals are swept only after every job state of their run, so runs can resume
+SEND_JOURNAL_DIR = os.getenv("SEND_JOURNAL_DIR", os.path.join(tempfile.gettempdir(), 'roambee_journals'))
+TEMP_FILE_TTL_SECONDS = int(os.getenv("TEMP_FILE_TTL_SECONDS", 24 * 3600))
+# Budget for TEMP_UPLOAD_DIR and SEND_JOURNAL_DIR together
+TEMP_DIR_MAX_BYTES = int(os.getenv("TEMP_DIR_MAX_BYTES", 2 * 1024 ** 3))
+TEMP_SWEEP_INTERVAL = int(os.getenv("TEMP_SWEEP_INTERVAL", 300))
+
+class Metrics:
+    """Process-local counters and histograms, rendered in Prometheus text format.
+
+    Each gunicorn worker keeps its own registry, so /metrics reports the
+    worker that served the scrape; label series by instance when scraping.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.definitions = {}
+        self.series = {}
+
+    def counter(self, name, help_text):
+        self.definitions[name] = ('counter', help_text, None)
+
+    def histogram(self, name, help_text, buckets):
+        self.definitions[name] = ('histogram', help_text, tuple(buckets))
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = self.definitions[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            counts = self.series.get(key)
+            if counts is None:
+                # Per-bucket counts plus the running sum and count
+                counts = self.series[key] = [0] * len(buckets) + [0.0, 0]
+            position = bisect.bisect_left(buckets, value)
+            if position < len(buckets):
+                counts[position] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self):
+        with self.lock:
+            series = {key: list(value) if isinstance(value, list) else value
+                      for key, value in self.series.items()}
+        lines = []
+        for name, (kind, help_text, buckets) in self.definitions.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (series_name, labels), value in sorted(series.items()):
+                if series_name != name:
+                    continue
+                if kind == 'counter':
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, value):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", repr(float(bound))),))} {cumulative}')
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {value[-1]}')
+                lines.append(f'{name}_sum{format_labels(labels)} {value[-2]}')
+                lines.append(f'{name}_count{format_labels(labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+metrics = Metrics()
+metrics.histogram('roambee_upload_parse_seconds', 'Time spent reading and cleaning an uploaded IMEI file', LATENCY_BUCKETS)
+metrics.counter('roambee_upload_imeis_total', 'Unique IMEIs accepted from uploads')
+metrics.histogram('roambee_limiter_wait_seconds', 'Time spent waiting for a rate-limiter token', LATENCY_BUCKETS)
+metrics.histogram('roambee_http_seconds', 'Roambee API request latency', LATENCY_BUCKETS)
+metrics.histogram('roambee_http_response_bytes', 'Roambee API response body size', SIZE_BUCKETS)
+metrics.histogram('roambee_post_process_seconds', 'Time spent turning API responses into report rows', LATENCY_BUCKETS)
+metrics.histogram('roambee_report_seconds', 'Time spent serializing report rows', LATENCY_BUCKETS)
+metrics.counter('roambee_upload_cache_total', 'Uploads by whether their parsed IMEI list was already cached')
+metrics.counter('roambee_temp_evictions_total', 'Upload, job and journal entries removed by the sweeper')
+metrics.counter('roambee_index_pruned_imeis_total', 'IMEIs dropped from the command index by the sweeper')
+metrics.counter('roambee_circuit_transitions_total', 'Circuit breaker state changes per endpoint')
+metrics.counter('roambee_api_key_transitions_total', 'API key health changes per endpoint and key')
+
+# Timing breakdown of the current request or job, if one is being collected
+current_timings = contextvars.ContextVar('current_timings', default=None)
+
+class TimingBreakdown:
+    """Seconds spent per phase, summed across every thread working on a job or request"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+
+    def add(self, phase, seconds):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def as_dict(self):
+        with self.lock:
+            return {phase: round(seconds, 3) for phase, seconds in self.phases.items()}
+
+def record_timing(phase, seconds, **labels):
+    """Observe roambee_<phase>_seconds and add it to the current breakdown"""
+    metrics.observe(f'roambee_{phase}_seconds', seconds, **labels)
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(phase, seconds)
+
+def in_current_context(fn):
+    """Wrap fn for an executor so each call sees the submitting thread's breakdown"""
+    context = contextvars.copy_context()
+    return lambda *args: context.copy().run(fn, *args)
+
+class TokenBucket:
+    """Thread-safe token bucket that limits outbound calls to `rate` per second"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available; returns the time spent waiting"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def set_rate(self, rate):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.rate = float(rate)
+
+    def release(self):
+        """Only the shared limiter tracks calls in flight"""
 
-# Cleanup function to remove temp files when app exits
-def cleanup_temp_files():
-    for filename in os.listdir(TEMP_UPLOAD_DIR):
-        file_path = os.path.join(TEMP_UPLOAD_DIR, filename)
+    def leave(self, owner):
+        """Only the shared limiter splits its rate between jobs"""
+
+# Job whose calls are being made, for the shared limiter's fair share
+current_job_id = contextvars.ContextVar('current_job_id', default=None)
+
+class SharedRateLimiter:
+    """Per-endpoint rate and in-flight limit shared through SQLite and split between busy jobs"""
+
+    def __init__(self, path, endpoint, rate):
+        self.path = path
+        self.endpoint = endpoint
+        self.local = threading.local()
+        self.rate = float(rate)
+
+    def connect(self):
+        """This thread's connection, creating the rate tables when it is opened"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS rate_limits (
+                endpoint TEXT PRIMARY KEY,
+                rate REAL NOT NULL,
+                next_slot REAL NOT NULL)""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS rate_shares (
+                endpoint TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                next_slot REAL NOT NULL,
+                in_flight INTEGER NOT NULL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (endpoint, owner))""")
+            conn.execute("INSERT OR IGNORE INTO rate_limits VALUES (?, ?, 0)", (self.endpoint, self.rate))
+            self.local.conn = conn
+        return conn
+
+    def owner(self):
+        return current_job_id.get() or f'pid-{os.getpid()}'
+
+    def acquire(self):
+        """Block until this job's next slot and a free in-flight place; returns the time spent waiting"""
+        owner = self.owner()
+        with self.transaction() as conn:
+            # Wall-clock time, since slots are compared across processes
+            now = time.time()
+            conn.execute("DELETE FROM rate_shares WHERE endpoint = ? AND last_seen < ?",
+                         (self.endpoint, now - RATE_SHARE_STALE_SECONDS))
+            conn.execute("INSERT OR IGNORE INTO rate_shares VALUES (?, ?, 0, 0, ?)", (self.endpoint, owner, now))
+            self.rate, global_slot = conn.execute(
+                "SELECT rate, next_slot FROM rate_limits WHERE endpoint = ?", (self.endpoint,)).fetchone()
+            # Only jobs with calls reserved ahead or outstanding split the rate,
+            # so an idle job does not hold back the busy ones
+            others, own_slot = conn.execute(
+                "SELECT COUNT(CASE WHEN owner != ? AND (next_slot > ? OR in_flight > 0) THEN 1 END), "
+                "MAX(CASE WHEN owner = ? THEN next_slot END) FROM rate_shares WHERE endpoint = ?",
+                (owner, now, owner, self.endpoint)).fetchone()
+            # The global slot only counts reservations; a job held back by its
+            # own share must not push the other jobs' slots back too
+            global_slot = max(now, global_slot)
+            slot = max(global_slot, own_slot)
+            conn.execute("UPDATE rate_limits SET next_slot = ? WHERE endpoint = ?",
+                         (global_slot + 1 / self.rate, self.endpoint))
+            conn.execute("UPDATE rate_shares SET next_slot = ?, last_seen = ? WHERE endpoint = ? AND owner = ?",
+                         (slot + (others + 1) / self.rate, now, self.endpoint, owner))
+        waited = max(0.0, slot - now)
+        time.sleep(waited)
+        
+        while True:
+            with self.transaction() as conn:
+                in_flight, = conn.execute("SELECT SUM(in_flight) FROM rate_shares WHERE endpoint = ?",
+                                          (self.endpoint,)).fetchone()
+                admitted = (in_flight or 0) < MAX_IN_FLIGHT
+                conn.execute("UPDATE rate_shares SET in_flight = in_flight + ?, last_seen = ? "
+                             "WHERE endpoint = ? AND owner = ?", (int(admitted), time.time(), self.endpoint, owner))
+            if admitted:
+                return waited
+            time.sleep(0.05)
+            waited += 0.05
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
         try:
-            if os.path.isfile(file_path):
-                os.unlink(file_path)
-        except Exception as e:
-            logger.error(f"Failed to delete {file_path}: {e}")
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
 
-atexit.register(cleanup_temp_files)
+    def release(self):
+        self.connect().execute(
+            "UPDATE rate_shares SET in_flight = MAX(in_flight - 1, 0) WHERE endpoint = ? AND owner = ?",
+            (self.endpoint, self.owner()))
 
-def clean_imei(imei):
-    """Clean and validate IMEI"""
-    if not isinstance(imei, str):
-        imei = str(imei)
-    imei = ''.join(c for c in imei if c.isdigit())
-    return imei if len(imei) >= 12 else None
+    def leave(self, owner):
+        """Give up a finished job's share of the rate"""
+        self.connect().execute("DELETE FROM rate_shares WHERE endpoint = ? AND owner = ?", (self.endpoint, owner))
 
-def get_imei_data():
-    """Helper function to load IMEI data from temp file"""
-    upload_id = session.get('imei_upload_id')
-    if not upload_id:
-        return None
-    
-    temp_path = os.path.join(TEMP_UPLOAD_DIR, f'{upload_id}.json')
+    def set_rate(self, rate):
+        self.rate = float(rate)
+        self.connect().execute("UPDATE rate_limits SET rate = ? WHERE endpoint = ?", (self.rate, self.endpoint))
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit breaker is open"""
+
+class CircuitBreaker:
+    """Fail-fast guard for one endpoint that opens on errors or timeouts and probes until the API answers"""
+
+    def __init__(self, name, probe):
+        self.name = name
+        self.probe = probe
+        self.state = 'closed'
+        self.outcomes = deque(maxlen=BREAKER_WINDOW)
+        self.consecutive_timeouts = 0
+        self.half_open_successes = 0
+        self.open_seconds = BREAKER_OPEN_SECONDS
+        self.lock = threading.Lock()
+
+    def check(self):
+        if self.state == 'open':
+            raise CircuitOpenError(f"Skipped: {self.name} API unavailable (circuit open)")
+
+    def record(self, healthy, timeout=False):
+        with self.lock:
+            if self.state == 'open':
+                # Late results from calls that were already in flight
+                return
+            if self.state == 'half_open':
+                if not healthy:
+                    self.open_seconds = min(BREAKER_MAX_OPEN_SECONDS, self.open_seconds * 2)
+                    self.transition('open')
+                else:
+                    self.half_open_successes += 1
+                    if self.half_open_successes >= BREAKER_HALF_OPEN_SUCCESSES:
+                        self.transition('closed')
+                return
+            
+            self.outcomes.append(healthy)
+            self.consecutive_timeouts = self.consecutive_timeouts + 1 if timeout else 0
+            failures = self.outcomes.count(False)
+            if (self.consecutive_timeouts >= BREAKER_CONSECUTIVE_TIMEOUTS
+                    or (len(self.outcomes) >= BREAKER_MIN_CALLS
+                        and failures / len(self.outcomes) >= BREAKER_ERROR_RATE)):
+                self.open_seconds = BREAKER_OPEN_SECONDS
+                self.transition('open')
+
+    def transition(self, state):
+        """Switch state; the caller holds the lock"""
+        logger.warning(f"{self.name}: circuit {self.state} -> {state}")
+        metrics.inc('roambee_circuit_transitions_total', endpoint=self.name, state=state)
+        self.state = state
+        self.outcomes.clear()
+        self.consecutive_timeouts = 0
+        self.half_open_successes = 0
+        if state == 'open':
+            threading.Thread(target=self.run_probe, daemon=True).start()
+
+    def run_probe(self):
+        delay = self.open_seconds
+        while True:
+            time.sleep(delay)
+            try:
+                healthy = self.probe()
+            except Exception as e:
+                logger.warning(f"{self.name}: probe failed: {str(e)}")
+                healthy = False
+            if healthy:
+                with self.lock:
+                    self.transition('half_open')
+                return
+            delay = min(BREAKER_MAX_OPEN_SECONDS, delay * 2)
+            self.open_seconds = delay
+
+class ApiKey:
+    """One API key's lane to an endpoint, with its own rate limiter and health.
+
+    A 429 marks the key throttled and benches it for KEY_THROTTLE_SECONDS,
+    doubling up to KEY_MAX_THROTTLE_SECONDS while it keeps being throttled;
+    its next healthy response makes it active again. A 401 or 403 marks it
+    revoked for the life of the process. Keys are identified by a short
+    hash in logs, metrics and the shared limiter, never by their value.
+    """
+
+    def __init__(self, endpoint, key, rate):
+        self.key = key
+        self.endpoint = endpoint
+        self.label = hashlib.sha256(str(key).encode()).hexdigest()[:8]
+        if RATE_LIMIT_DB_PATH:
+            self.limiter = SharedRateLimiter(RATE_LIMIT_DB_PATH, f'{endpoint}:{self.label}', rate)
+        else:
+            self.limiter = TokenBucket(rate)
+        self.state = 'active'
+        self.in_flight = 0
+        self.benched_until = 0.0
+        self.bench_seconds = KEY_THROTTLE_SECONDS
+        self.last_decrease = 0.0
+
+    @property
+    def rate(self):
+        return self.limiter.rate
+
+    def ready(self, now):
+        return self.state == 'active' or (self.state == 'throttled' and now >= self.benched_until)
+
+    def transition(self, state):
+        """Switch health state; the caller holds the controller lock"""
+        if state == 'throttled':
+            if self.state == 'throttled':
+                self.bench_seconds = min(KEY_MAX_THROTTLE_SECONDS, self.bench_seconds * 2)
+            else:
+                self.bench_seconds = KEY_THROTTLE_SECONDS
+            self.benched_until = time.time() + self.bench_seconds
+        if state != self.state:
+            logger.warning(f"{self.endpoint}: API key {self.label} {self.state} -> {state}")
+            metrics.inc('roambee_api_key_transitions_total', endpoint=self.endpoint, key=self.label, state=state)
+            self.state = state
+
+class AdaptiveController:
+    """AIMD tuning of batch size and request rate for one API endpoint.
+
+    Every outbound call goes through call(), which picks an API key, takes
+    a token from that key's rate limiter and times the request. Healthy
+    responses add a step to the batch size and the key's rate; HTTP 429/5xx,
+    timeouts, connection errors and responses slower than
+    SLOW_RESPONSE_SECONDS halve both, at most once per DECREASE_COOLDOWN
+    per key. A CircuitBreaker in front of the limiters fails calls fast
+    while the API is down.
+    """
+
+    def __init__(self, name, batch_size=BATCH_SIZE, rate=REQUEST_RATE):
+        self.name = name
+        self.batch_size = batch_size
+        self.breaker = CircuitBreaker(name, probe_api)
+        self.keys = [ApiKey(name, key, rate) for key in API_KEYS]
+        self.lock = threading.Lock()
+
+    @property
+    def rate(self):
+        """Combined rate of every key still in use"""
+        live = [key for key in self.keys if key.state != 'revoked'] or self.keys
+        return sum(key.rate for key in live)
+
+    def set_rate(self, rate):
+        """Set every key's rate"""
+        for key in self.keys:
+            key.limiter.set_rate(rate)
+
+    def leave(self, owner):
+        """Give up a finished job's share of every key's rate"""
+        for key in self.keys:
+            key.limiter.leave(owner)
+
+    def pick_key(self, exclude=()):
+        """Least-loaded key: fewest calls in flight per unit of rate.
+
+        Throttled keys are used only while no key is ready, and revoked keys
+        only when nothing else is left, so the API error still surfaces.
+        With `exclude` (a retry), only a ready key that has not been tried
+        is returned, else None.
+        """
+        now = time.time()
+        with self.lock:
+            candidates = [key for key in self.keys if key not in exclude and key.state != 'revoked']
+            ready = [key for key in candidates if key.ready(now)]
+            pool = ready if exclude else (ready or candidates or self.keys)
+            if not pool:
+                return None
+            key = min(pool, key=lambda key: (key.in_flight + 1) / key.rate)
+            key.in_flight += 1
+            return key
+
+    def call(self, method, url, **kwargs):
+        """Make one call, moving to another ready key when a key is throttled or revoked"""
+        self.breaker.check()
+        tried = []
+        key = self.pick_key()
+        while key is not None:
+            tried.append(key)
+            try:
+                response = self.call_with_key(key, method, url, **kwargs)
+            finally:
+                with self.lock:
+                    key.in_flight -= 1
+            if response.status_code not in (401, 403, 429):
+                return response
+            key = self.pick_key(tried)
+        return response
+
+    def call_with_key(self, key, method, url, **kwargs):
+        kwargs['headers'] = {**kwargs.get('headers', {}), 'apikey': key.key}
+        record_timing('limiter_wait', key.limiter.acquire(), endpoint=self.name)
+        started = time.monotonic()
+        try:
+            # The circuit may have opened while this call waited for its slot
+            self.breaker.check()
+            response = get_http_session().request(method, url, **kwargs)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            record_timing('http', time.monotonic() - started, endpoint=self.name, code=type(e).__name__)
+            self.record(key, False)
+            self.breaker.record(False, timeout=isinstance(e, requests.exceptions.Timeout))
+            raise
+        finally:
+            key.limiter.release()
+        latency = time.monotonic() - started
+        record_timing('http', latency, endpoint=self.name, code=str(response.status_code))
+        metrics.observe('roambee_http_response_bytes', len(response.content), endpoint=self.name)
+        
+        if response.status_code in (401, 403):
+            with self.lock:
+                key.transition('revoked')
+        elif response.status_code == 429 or response.status_code >= 500 or latency > SLOW_RESPONSE_SECONDS:
+            self.record(key, False)
+        elif response.status_code < 400:
+            self.record(key, True)
+        if response.status_code == 429:
+            with self.lock:
+                key.transition('throttled')
+        else:
+            self.breaker.record(response.status_code < 500)
+        return response
+
+    def record(self, key, healthy):
+        with self.lock:
+            if healthy:
+                if key.state == 'throttled':
+                    key.transition('active')
+                self.batch_size = min(MAX_BATCH_SIZE, self.batch_size + BATCH_INCREASE_STEP)
+                rate = min(MAX_REQUEST_RATE, key.rate + RATE_INCREASE_STEP)
+            else:
+                now = time.monotonic()
+                if now - key.last_decrease < DECREASE_COOLDOWN:
+                    return
+                key.last_decrease = now
+                self.batch_size = max(MIN_BATCH_SIZE, self.batch_size // 2)
+                rate = max(MIN_REQUEST_RATE, key.rate / 2)
+                logger.warning(f"{self.name}: backing off to batch size {self.batch_size}, "
+                               f"{rate:.2f} req/s on key {key.label}")
+            key.limiter.set_rate(rate)
+
+def probe_api():
+    """One-row bee_commands query used as the API health probe.
+
+    send_commands has no side-effect-free request, so this probe stands in
+    for both endpoints. It bypasses the controllers and their limiters.
+    """
+    rbql = build_status_rbql(['0'], 0, 0, 1)
+    rbql['pagination']['page_size'] = 1
+    url = f"{STATUS_BASE_URL}?rbql={quote(json.dumps(rbql, separators=(',', ':')))}&isResellerAdmin=true"
+    headers = {**STATUS_HEADERS, 'apikey': API_KEYS[0]}
+    return get_http_session().get(url, headers=headers, timeout=10).status_code < 500
+
+send_controller = AdaptiveController('send_commands')
+status_controller = AdaptiveController('bee_commands')
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    """Shared keep-alive session sized for batch and page workers together"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            from requests.adapters import HTTPAdapter
+            http = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=2 * MAX_CONCURRENT_BATCHES)
+            http.mount('https://', adapter)
+            http.mount('http://', adapter)
+            _http_session = http
+        return _http_session
+
+_page_executor = None
+_page_executor_lock = threading.Lock()
+
+def get_page_executor():
+    """Pool for page and shard fetches, started on first use.
+
+    Those fetches never submit further work here, so batch workers can wait
+    on this pool without risk of deadlock.
+    """
+    global _page_executor
+    with _page_executor_lock:
+        if _page_executor is None:
+            _page_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BATCHES)
+        return _page_executor
+
+def dispatch_batches(items, worker, controller, pack=None):
+    """Run worker(batch) over the items with several batches in flight.
+
+    Batches are cut as they are dispatched, using the controller's current
+    batch size, or pack(items, position, batch_size) when the request size
+    also limits a batch. Workers make their calls through controller.call(),
+    so the rate limit holds across all threads. Results are yielded in batch
+    order.
+    """
+    pending = deque()
+    position = 0
+    worker = in_current_context(worker)
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BATCHES) as executor:
+        while position < len(items) or pending:
+            while position < len(items) and len(pending) < MAX_CONCURRENT_BATCHES:
+                if pack is None:
+                    end = position + controller.batch_size
+                else:
+                    end = pack(items, position, controller.batch_size)
+                batch = items[position:end]
+                position += len(batch)
+                pending.append(executor.submit(worker, batch))
+            yield pending.popleft().result()
+
+def clean_imeis(values, luhn_check=False):
+    """Vectorized clean and validate of a Series of raw IMEI cells"""
+    imeis = (values.dropna().astype(str)
+             .str.replace(r'\.0+$', '', regex=True)
+             .str.replace(r'\D', '', regex=True))
+    imeis = imeis[imeis.str.len() >= 12]
+    if luhn_check:
+        fifteen = imeis.str.len() == 15
+        valid = pd.Series(True, index=imeis.index)
+        valid[fifteen] = luhn_valid(imeis[fifteen])
+        imeis = imeis[valid]
+    return imeis
+
+def luhn_valid(imeis):
+    """Luhn checksum over a Series of 15-digit strings"""
+    if imeis.empty:
+        return np.array([], dtype=bool)
+    digits = (np.frombuffer(''.join(imeis).encode('ascii'), dtype=np.uint8)
+              .reshape(-1, 15).astype(np.int64) - 48)
+    doubled = digits[:, 1::2] * 2
+    doubled -= 9 * (doubled > 9)
+    return (digits[:, 0::2].sum(axis=1) + doubled.sum(axis=1)) % 10 == 0
+
+def find_imei_column(columns):
+    """First column whose name contains 'imei' (case insensitive)"""
+    for col in columns:
+        if col is not None and 'imei' in str(col).lower():
+            return col
+    return None
+
+def find_upload_columns(header):
+    """Map the 'imei' field and the optional 'command' and 'device_type' fields to upload columns.
+
+    Raises LookupError if there is no IMEI column.
+    """
+    imei_col = find_imei_column(header)
+    if imei_col is None:
+        raise LookupError(f"Columns found: {list(header)}")
+    columns = {'imei': imei_col}
+    for col in header:
+        if col is None or col == imei_col:
+            continue
+        name = re.sub(r'[^a-z]', '', str(col).lower())
+        if 'command' in name:
+            columns.setdefault('command', col)
+        elif 'devicetype' in name:
+            columns.setdefault('device_type', col)
+    return columns
+
+def read_upload_chunks(path, extension):
+    """Yield the IMEI column of an uploaded file, plus any command and device type columns.
+
+    Chunks are DataFrames of raw cell values keyed by field name. Only the
+    header and those columns are parsed: CSVs are read in IMEI_CHUNK_ROWS
+    chunks and xlsx sheets are iterated in openpyxl read-only mode.
+    """
+    if extension == 'csv':
+        columns = find_upload_columns(pd.read_csv(path, nrows=0, encoding='utf-8-sig').columns)
+        logger.info(f"Reading columns: {columns}")
+        names = {col: field for field, col in columns.items()}
+        for chunk in pd.read_csv(path, usecols=list(names), dtype=str, encoding='utf-8-sig',
+                                 chunksize=IMEI_CHUNK_ROWS):
+            yield chunk.rename(columns=names)
+    elif extension == 'xlsx':
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.active
+            header = next(sheet.iter_rows(max_row=1, values_only=True), ())
+            columns = find_upload_columns(header)
+            logger.info(f"Reading columns: {columns}")
+            positions = {field: header.index(col) for field, col in columns.items()}
+            first, last = min(positions.values()), max(positions.values())
+            offsets = {field: position - first for field, position in positions.items()}
+            rows = []
+            for row in sheet.iter_rows(min_row=2, min_col=first + 1, max_col=last + 1, values_only=True):
+                rows.append(row)
+                if len(rows) >= IMEI_CHUNK_ROWS:
+                    yield pd.DataFrame({field: [row[offset] for row in rows] for field, offset in offsets.items()},
+                                       dtype=object)
+                    rows = []
+            if rows:
+                yield pd.DataFrame({field: [row[offset] for row in rows] for field, offset in offsets.items()},
+                                   dtype=object)
+        finally:
+            workbook.close()
+    else:
+        columns = find_upload_columns(pd.read_excel(path, nrows=0).columns)
+        logger.info(f"Reading columns: {columns}")
+        names = {col: field for field, col in columns.items()}
+        yield pd.read_excel(path, usecols=list(names), dtype=str).rename(columns=names)
+
+def upload_meta_path(upload_id):
+    return os.path.join(TEMP_UPLOAD_DIR, f'{upload_id}.json')
+
+def read_upload_meta(upload_id):
+    """Load an upload's metadata and mark it as recently used, or None if it is gone"""
+    temp_path = upload_meta_path(upload_id)
     try:
         with open(temp_path, 'r') as f:
-            return json.load(f)
+            meta = json.load(f)
+        os.utime(temp_path)
     except:
         return None
+    meta['upload_id'] = upload_id
+    return meta
+
+def get_upload_meta():
+    """Load the session's upload metadata without touching its IMEI payload"""
+    upload_id = session.get('imei_upload_id')
+    if not upload_id:
+        return None
+    
+    meta = read_upload_meta(upload_id)
+    if meta is not None:
+        # Uploads are shared by content, so the file name is per session
+        meta['filename'] = session.get('imei_upload_filename', meta.get('filename', ''))
+    return meta
+
+def save_upload_stream(file, path):
+    """Stream an uploaded file to disk; returns the SHA-256 of its content"""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as out:
+        for block in iter(lambda: file.stream.read(1024 * 1024), b''):
+            digest.update(block)
+            out.write(block)
+    return digest.hexdigest()
+
+def save_npy(path, array):
+    """np.save via a temporary file, so readers in other workers never see a partial array"""
+    temp_path = f'{path[:-len(".npy")]}.{uuid.uuid4().hex}.tmp.npy'
+    np.save(temp_path, array)
+    os.replace(temp_path, path)
+
+def imei_store_path(upload_id):
+    return os.path.join(TEMP_UPLOAD_DIR, f'{upload_id}.npy')
+
+def save_imei_array(path, imeis):
+    """Write IMEIs as a memory-mappable .npy array.
+
+    IMEIs are packed as int64 when every value fits and has no leading zero;
+    otherwise they are stored as fixed-width bytes so no digits are lost.
+    """
+    values = pd.Series(imeis, dtype=object)
+    if (values.str.len() <= 18).all() and not values.str.startswith('0').any():
+        array = values.astype(np.int64).to_numpy()
+    else:
+        array = np.array(values.tolist(), dtype='S')
+    save_npy(path, array)
+
+def load_imei_array(path):
+    return np.load(path, mmap_mode='r').astype(str).tolist()
+
+def save_imei_store(upload_id, imeis):
+    save_imei_array(imei_store_path(upload_id), imeis)
+
+UPLOAD_FIELDS = ('command', 'device_type')
+
+def upload_field_path(upload_id, field):
+    return os.path.join(TEMP_UPLOAD_DIR, f'{upload_id}.{field}.npy')
+
+def save_upload_fields(upload_id, upload):
+    """Store the upload's optional per-IMEI columns as codes into their distinct values.
+
+    Each field is saved as an int32 .npy array aligned with the IMEI store,
+    with -1 for blank cells; the distinct values are returned for the
+    upload metadata.
+    """
+    fields = {}
+    for field in UPLOAD_FIELDS:
+        if field not in upload:
+            continue
+        values = upload[field].astype('string').str.strip().replace('', pd.NA)
+        codes, uniques = pd.factorize(values)
+        save_npy(upload_field_path(upload_id, field), codes.astype(np.int32))
+        fields[field] = [str(value) for value in uniques]
+    return fields
 
-@app.route('/')
+def load_upload_field(upload_id, field):
+    return np.load(upload_field_path(upload_id, field))
+
+_imei_cache = OrderedDict()
+_imei_cache_lock = threading.Lock()
+
+def load_imei_list(upload_id):
+    """IMEI list for an upload, served from a bounded LRU cache"""
+    with _imei_cache_lock:
+        if upload_id in _imei_cache:
+            _imei_cache.move_to_end(upload_id)
+            return _imei_cache[upload_id]
+    
+    imei_list = load_imei_array(imei_store_path(upload_id))
+    
+    with _imei_cache_lock:
+        _imei_cache[upload_id] = imei_list
+        _imei_cache.move_to_end(upload_id)
+        while len(_imei_cache) > IMEI_CACHE_SIZE:
+            _imei_cache.popitem(last=False)
+    return imei_list
+
+def evict_imei_list(upload_id):
+    with _imei_cache_lock:
+        _imei_cache.pop(upload_id, None)
+
+@bp.before_app_request
+def start_request_timings():
+    # ?timing=1 returns this request's breakdown in a Server-Timing header.
+    # Always reset, since sync workers reuse the thread for the next request
+    timing = request.args.get('timing') == '1'
+    current_timings.set(TimingBreakdown() if timing else None)
+    request.timing_started = time.perf_counter()
+
+@bp.after_app_request
+def add_server_timing(response):
+    timings = current_timings.get()
+    if timings is not None:
+        phases = dict(timings.as_dict(), total=time.perf_counter() - request.timing_started)
+        response.headers['Server-Timing'] = ', '.join(
+            f'{phase};dur={seconds * 1000:.1f}' for phase, seconds in phases.items())
+    return response
+
+@bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/')
 def index():
-    imei_data = get_imei_data()
-    has_imeis = bool(imei_data and imei_data.get('imei_list', []))
-    filename = imei_data.get('filename', '') if imei_data else ''
-    imei_count = len(imei_data.get('imei_list', [])) if imei_data else 0
+    meta = get_upload_meta()
+    has_imeis = bool(meta and meta.get('imei_count'))
+    filename = meta.get('filename', '') if meta else ''
+    imei_count = meta.get('imei_count', 0) if meta else 0
     
     return render_template('index.html',
                          has_imeis=has_imeis,
                          filename=filename,
                          imei_count=imei_count)
 
-@app.route('/upload', methods=['POST'])
+@bp.route('/upload', methods=['POST'])
 def upload_file():
     session.permanent = True
     
@@ -94,215 +951,1084 @@ def upload_file():
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
 
+    extension = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+    if extension not in ALLOWED_EXTENSIONS:
+        return jsonify({'error': 'Invalid file format'}), 400
+    
+    luhn_check = request.form.get('luhn', str(IMEI_LUHN_CHECK)).lower() == 'true'
+    
+    # Stream the upload to disk rather than holding it in memory
+    upload_path = os.path.join(TEMP_UPLOAD_DIR, f'{uuid.uuid4()}.upload.{extension}')
     try:
-        # Read file content
-        file_content = file.read()
-        
-        try:
-            if file.filename.lower().endswith('.csv'):
-                file_content = file_content.decode('utf-8-sig').encode('utf-8')
-                df = pd.read_csv(io.BytesIO(file_content))
-            else:
-                df = pd.read_excel(io.BytesIO(file_content))
-        except Exception as e:
-            logger.error(f"File read error: {str(e)}")
-            return jsonify({'error': 'Invalid file format'}), 400
-        
+        digest = save_upload_stream(file, upload_path)
         logger.info(f"Processing file: {file.filename}")
-        logger.info(f"Columns found: {df.columns.tolist()}")
-        logger.info(f"First few rows:\n{df.head()}")
-        
-        # Find IMEI column (case insensitive)
-        imei_col = None
-        for col in df.columns:
-            if 'imei' in col.lower():
-                imei_col = col
-                break
-                
-        if imei_col is None:
-            logger.error("No IMEI column found")
-            return jsonify({'error': 'No column containing "IMEI" found'}), 400
-            
-        # Process IMEIs with proper cleaning
-        imei_list = df[imei_col].apply(clean_imei).dropna().unique().tolist()
-        
-        if not imei_list:
-            logger.error("No valid IMEIs found after cleaning")
-            return jsonify({'error': 'No valid IMEIs found in the file'}), 400
-        
-        # Generate unique ID for this upload
-        upload_id = str(uuid.uuid4())
-        temp_path = os.path.join(TEMP_UPLOAD_DIR, f'{upload_id}.json')
         
-        # Save to temporary file
-        with open(temp_path, 'w') as f:
-            json.dump({
-                'imei_list': imei_list,
-                'filename': secure_filename(file.filename),
-                'upload_time': datetime.now().isoformat()
-            }, f)
+        # Parsed uploads are keyed by content and by the options that affect parsing
+        upload_id = f"{digest}-{extension}{'-luhn' if luhn_check else ''}"
+        meta = read_upload_meta(upload_id)
+        if meta is not None:
+            metrics.inc('roambee_upload_cache_total', result='hit')
+            logger.info(f"Reusing parsed upload {upload_id}")
+        else:
+            metrics.inc('roambee_upload_cache_total', result='miss')
+            meta, error = parse_upload(upload_id, upload_path, extension, luhn_check, file.filename)
+            if error:
+                return jsonify({'error': error}), 400
         
         # Store just the reference in session
         session['imei_upload_id'] = upload_id
+        session['imei_upload_filename'] = secure_filename(file.filename)
+        
+        logger.info(f"Successfully processed {meta['imei_count']} IMEIs")
         
-        logger.info(f"Successfully processed {len(imei_list)} IMEIs")
-        logger.debug(f"Sample IMEIs: {imei_list[:5]}")
-
         return jsonify({
             'success': True,
-            'imei_count': len(imei_list),
-            'filename': secure_filename(file.filename)
+            'imei_count': meta['imei_count'],
+            'filename': secure_filename(file.filename),
+            'command_count': len(meta['fields'].get('command', [])),
+            'device_types': meta['fields'].get('device_type', [])
         })
     
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}", exc_info=True)
         return jsonify({'error': f'Failed to process file: {str(e)}'}), 400
+    finally:
+        try:
+            os.unlink(upload_path)
+        except OSError:
+            pass
 
-@app.route('/send_command', methods=['GET'])
+def parse_upload(upload_id, upload_path, extension, luhn_check, filename):
+    """Parse an uploaded file into the IMEI store; returns (metadata, error message)"""
+    started = time.perf_counter()
+    try:
+        frames = []
+        for chunk in read_upload_chunks(upload_path, extension):
+            imeis = clean_imeis(chunk['imei'], luhn_check)
+            frames.append(chunk.loc[imeis.index].assign(imei=imeis).drop_duplicates('imei'))
+    except LookupError as e:
+        logger.error(f"No IMEI column found. {str(e)}")
+        return None, 'No column containing "IMEI" found'
+    except Exception as e:
+        logger.error(f"File read error: {str(e)}")
+        return None, 'Invalid file format'
+    
+    # The first row wins when an IMEI appears more than once
+    upload = pd.concat(frames, ignore_index=True).drop_duplicates('imei') if frames else None
+    imeis = upload['imei'].to_numpy() if upload is not None else []
+    record_timing('upload_parse', time.perf_counter() - started, format=extension)
+    metrics.inc('roambee_upload_imeis_total', len(imeis))
+    
+    if not len(imeis):
+        logger.error("No valid IMEIs found after cleaning")
+        return None, 'No valid IMEIs found in the file'
+    
+    # The metadata file goes last and atomically: once it exists the upload is complete
+    save_imei_store(upload_id, imeis)
+    meta = {
+        'imei_count': len(imeis),
+        'filename': secure_filename(filename),
+        'upload_time': datetime.now().isoformat(),
+        'fields': save_upload_fields(upload_id, upload)
+    }
+    temp_path = f'{upload_meta_path(upload_id)}.{uuid.uuid4().hex}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(temp_path, upload_meta_path(upload_id))
+    logger.debug(f"Sample IMEIs: {imeis[:5]}")
+    return meta, None
+
+@bp.route('/send_command', methods=['GET'])
 def send_command_page():
     session.permanent = True
-    if not get_imei_data():
-        return redirect(url_for('index'))
-    return render_template('send_command.html')
+    meta = get_upload_meta()
+    if not meta:
+        return redirect(url_for('.index'))
+    return render_template('send_command.html',
+                         upload_command_count=len(meta.get('fields', {}).get('command', [])))
+
+def post_command_batch(batch_imeis, commands):
+    """POST one batch of IMEIs and the command sequence they all receive to SEND_URL.
+
+    Returns (status, detailed_response, ids, transient), where transient
+    marks failures worth retrying: HTTP 429/5xx, timeouts and connection errors.
+    """
+    headers = {"Content-Type": "application/json"}
+    ids = []
+    transient = False
+    
+    try:
+        command_data = {
+            "protocol": "WIRE",
+            "imeis": batch_imeis,
+            "commands": list(commands),
+            "password": None
+        }
+        payload = {
+                "data": json.dumps(command_data)
+            }
+        
+        logger.info(f"Sending {len(commands)} command(s) to {len(batch_imeis)} devices: {commands}")
+        
+        response = send_controller.call(
+            'POST',
+            SEND_URL,
+            headers=headers,
+            json=payload,
+            timeout=30
+        )
+        
+        response_text = response.text.strip()
+        status = "Failed"
+        detailed_response = "No valid response from API"
+        
+        if response.status_code == 200:
+            try:
+                response_data = response.json()
+                if isinstance(response_data, dict):
+                    if "ids" in response_data:
+                        status = "Success"
+                        detailed_response = "Command queued successfully"
+                        ids = response_data["ids"] or []
+                    elif response_data.get("success", False):
+                        status = "Success"
+                        detailed_response = str(response_data)
+                    else:
+                        detailed_response = f"API returned unsuccessful response: {response_data}"
+                else:
+                    detailed_response = f"Unexpected API response format: {response_data}"
+            except ValueError:
+                if "success" in response_text.lower():
+                    status = "Success"
+                    detailed_response = response_text
+                else:
+                    detailed_response = f"Invalid JSON response: {response_text}"
+        else:
+            detailed_response = f"API Error {response.status_code}: {response_text}"
+            transient = response.status_code == 429 or response.status_code >= 500
+    
+    except CircuitOpenError as e:
+        status = "Skipped"
+        detailed_response = str(e)
+    except requests.exceptions.RequestException as e:
+        status = "Error"
+        detailed_response = f"Request failed: {str(e)}"
+        transient = isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+        logger.error(detailed_response)
+    except Exception as e:
+        status = "Error"
+        detailed_response = f"Unexpected error: {str(e)}"
+        logger.error(detailed_response)
+    
+    return status, detailed_response, ids, transient
+
+def send_batch(batch_imeis, commands, journal=None, verifier=None):
+    """Send one command batch, retrying transient failures, and return its report rows.
+
+    Retries use exponential backoff with full jitter. The final outcome is
+    written to the run's journal before the rows are returned, and the
+    returned command ids are handed to the verifier, if any.
+    """
+    attempts = 0
+    while True:
+        attempts += 1
+        status, detailed_response, ids, transient = post_command_batch(batch_imeis, commands)
+        if not transient or attempts > SEND_MAX_RETRIES:
+            break
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1)))
+        logger.warning(f"Retrying batch of {len(batch_imeis)} in {delay:.1f}s: {detailed_response}")
+        time.sleep(delay)
+    
+    if journal is not None:
+        journal.record(batch_imeis, status, ids, detailed_response, attempts)
+    if verifier is not None and ids:
+        verifier.track(ids)
+    
+    started = time.perf_counter()
+    count = len(batch_imeis)
+    rows = RowBatch.compact({
+        "IMEI": list(batch_imeis),
+        "Command": ['; '.join(commands)] * count,
+        "Status": [status] * count,
+        "Response": [detailed_response] * count,
+        "Timestamp": [time.time()] * count,
+        "Batch Size": [count] * count,
+        "Request Rate": [round(send_controller.rate, 2)] * count
+    })
+    record_timing('post_process', time.perf_counter() - started, kind='send')
+    return rows
+
+class SendJournal:
+    """Append-only NDJSON record of a send run, one line per finished batch.
+
+    The first line holds the run's command sequences; its IMEI list and each
+    IMEI's sequence code sit next to it as .npy arrays. Journals live in
+    SEND_JOURNAL_DIR so they survive the TEMP_UPLOAD_DIR cleanup on restart.
+    """
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.path = os.path.join(SEND_JOURNAL_DIR, f'{run_id}.ndjson')
+        self.imeis_path = os.path.join(SEND_JOURNAL_DIR, f'{run_id}.npy')
+        self.codes_path = os.path.join(SEND_JOURNAL_DIR, f'{run_id}.codes.npy')
+        self.lock = threading.Lock()
 
-@app.route('/api/send_command', methods=['POST'])
+    @classmethod
+    def create(cls, run_id, plan):
+        journal = cls(run_id)
+        save_imei_array(journal.imeis_path, plan.imeis)
+        np.save(journal.codes_path, plan.codes)
+        with open(journal.path, 'w') as f:
+            f.write(json.dumps({'sequences': plan.sequences, 'created': datetime.now().isoformat()}) + '\n')
+        return journal
+
+    def record(self, batch_imeis, status, ids, response, attempts):
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps({
+                    'imeis': batch_imeis,
+                    'status': status,
+                    'ids': ids,
+                    'response': response,
+                    'attempts': attempts,
+                    'time': datetime.now().isoformat()
+                }) + '\n')
+
+    def read(self):
+        """Return (header, batch records); a torn final line is ignored"""
+        records = []
+        with open(self.path, 'r') as f:
+            header = json.loads(f.readline())
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                record['batch'] = len(records)
+                records.append(record)
+        return header, records
+
+    def remaining(self):
+        """CommandPlan for the IMEIs that no batch has had accepted yet"""
+        header, records = self.read()
+        accepted = set()
+        for record in records:
+            if record['status'] == 'Success':
+                accepted.update(record['imeis'])
+        imeis = load_imei_array(self.imeis_path)
+        codes = np.load(self.codes_path)
+        keep = np.array([imei not in accepted for imei in imeis], dtype=bool)
+        return CommandPlan([imei for imei, kept in zip(imeis, keep) if kept], header['sequences'], codes[keep])
+
+class CommandPlan:
+    """IMEIs grouped by the command sequence each one should receive.
+
+    `sequences` lists the distinct command sequences and `codes` gives each
+    IMEI's index into it. IMEIs are reordered so every sequence is
+    contiguous, and pack() never lets a batch cross a sequence boundary, so a
+    group of n IMEIs costs ceil(n / batch size) requests. A run with several
+    sequences therefore reports its IMEIs grouped by sequence, in upload
+    order within each group.
+    """
+
+    def __init__(self, imei_list, sequences, codes):
+        codes = np.asarray(codes, dtype=np.int32)
+        order = np.argsort(codes, kind='stable')
+        self.imeis = [imei_list[i] for i in order]
+        self.codes = codes[order]
+        self.sequences = sequences
+        starts = np.flatnonzero(np.diff(self.codes)) + 1
+        self.boundaries = starts.tolist() + [len(self.imeis)]
+        self.code_of = dict(zip(self.imeis, self.codes.tolist())) if len(starts) else None
+
+    @classmethod
+    def single(cls, imei_list, commands):
+        return cls(imei_list, [commands], np.zeros(len(imei_list), dtype=np.int32))
+
+    def pack(self, items, position, batch_size):
+        boundary = self.boundaries[bisect.bisect_right(self.boundaries, position)]
+        return min(position + batch_size, boundary)
+
+    def batch_count(self, position, batch_size):
+        """Batches pack() cuts from `position` to the end"""
+        count = 0
+        for boundary in self.boundaries:
+            if boundary > position:
+                count += ceil((boundary - position) / batch_size)
+                position = boundary
+        return count
+
+    def commands_for(self, batch_imeis):
+        if self.code_of is None:
+            return self.sequences[int(self.codes[0])]
+        return self.sequences[self.code_of[batch_imeis[0]]]
+
+    def __len__(self):
+        return len(self.imeis)
+
+@bp.route('/api/send_command', methods=['POST'])
 def send_command():
-    """Handle command sending with improved error handling"""
-    imei_data = get_imei_data()
-    if not imei_data or not imei_data.get('imei_list'):
+    """Start a background command run and return its job ID"""
+    meta = get_upload_meta()
+    if not meta or not meta.get('imei_count'):
         return jsonify({'error': 'No IMEI list uploaded'}), 400
     
     if not request.is_json:
         return jsonify({'error': 'Content-Type must be application/json'}), 415
     
     data = request.get_json()
-    command = data.get('command', '').strip()
+    command = parse_commands(data.get('command', ''))
+    command_source = data.get('command_source', 'request')
+    report_format = data.get('format', 'xlsx')
     
-    if not command:
+    if command_source not in ('request', 'upload', 'device_type'):
+        return jsonify({'error': 'command_source must be one of: request, upload, device_type'}), 400
+    
+    if command_source == 'request' and not command:
         return jsonify({'error': 'No command provided'}), 400
     
-    imei_list = imei_data['imei_list']
-    results = []
-    total_imeis = len(imei_list)
-    total_batches = ceil(total_imeis / BATCH_SIZE)
+    if report_format not in REPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format. Use one of: {", ".join(REPORT_FORMATS)}'}), 400
     
-    headers = {
-        "Content-Type": "application/json",
-        "apikey": API_KEY
-    }
+    verify_timeout = None
+    if data.get('verify', False):
+        try:
+            verify_timeout = float(data.get('verify_timeout', VERIFY_TIMEOUT))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'verify_timeout must be a number of seconds'}), 400
+        if not 0 < verify_timeout <= WATCH_MAX_TIMEOUT:
+            return jsonify({'error': f'verify_timeout must be positive and at most {WATCH_MAX_TIMEOUT:g}s'}), 400
     
-    for batch_num in range(total_batches):
-        start_idx = batch_num * BATCH_SIZE
-        end_idx = min((batch_num + 1) * BATCH_SIZE, total_imeis)
-        batch_imeis = imei_list[start_idx:end_idx]
-        
+    imei_list = load_imei_list(meta['upload_id'])
+    if command_source == 'request':
+        plan = CommandPlan.single(imei_list, command)
+    else:
         try:
-            command_data = {
-                "protocol": "WIRE",
-                "imeis": batch_imeis,
-                "commands": [command],
-                "password": None
-            }
-            payload = {
-                    "data": json.dumps(command_data)
-                }
-            
-            logger.info(f"Sending command to {len(batch_imeis)} devices: {command}")
-            
-            response = requests.post(
-                SEND_URL,
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            
-            response_text = response.text.strip()
-            status = "Failed"
-            detailed_response = "No valid response from API"
-            
-            if response.status_code == 200:
-                try:
-                    response_data = response.json()
-                    if isinstance(response_data, dict):
-                        if "ids" in response_data:
-                            status = "Success"
-                            detailed_response = "Command queued successfully"
-                        elif response_data.get("success", False):
-                            status = "Success"
-                            detailed_response = str(response_data)
-                        else:
-                            detailed_response = f"API returned unsuccessful response: {response_data}"
-                    else:
-                        detailed_response = f"Unexpected API response format: {response_data}"
-                except ValueError:
-                    if "success" in response_text.lower():
-                        status = "Success"
-                        detailed_response = response_text
-                    else:
-                        detailed_response = f"Invalid JSON response: {response_text}"
-            else:
-                detailed_response = f"API Error {response.status_code}: {response_text}"
-            
-            for imei in batch_imeis:
-                results.append({
-                    "IMEI": imei,
-                    "Command": command,
-                    "Status": status,
-                    "Response": detailed_response,
-                    "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-            
-            time.sleep(DELAY_BETWEEN_BATCHES)
+            plan = upload_command_plan(meta, imei_list, command_source, data.get('device_commands'), command)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    job = start_send_job(plan, report_format, verify_timeout=verify_timeout)
+    
+    return jsonify({
+        'job_id': job['job_id'],
+        'total_batches': job['total_batches'],
+        'command_groups': len(plan.boundaries)
+    }), 202
+
+def parse_commands(value):
+    """Command sequence from a string with one command per line, or a list of strings"""
+    if isinstance(value, str):
+        value = value.splitlines()
+    if not isinstance(value, list):
+        return []
+    return [str(command).strip() for command in value if str(command).strip()]
+
+def upload_command_plan(meta, imei_list, command_source, device_commands, fallback):
+    """CommandPlan from the upload's command column or a device type to command mapping.
+
+    Blank command cells and unmapped device types get the fallback command
+    sequence; without one they raise ValueError, as does a missing column.
+    Identical sequences share one group whatever cell or device type they
+    came from.
+    """
+    field = 'command' if command_source == 'upload' else 'device_type'
+    values = meta.get('fields', {}).get(field)
+    if values is None:
+        raise ValueError(f'Uploaded file has no {field.replace("_", " ")} column')
+    
+    if command_source == 'upload':
+        value_sequences = [parse_commands(value) for value in values]
+    else:
+        if not isinstance(device_commands, dict) or not device_commands:
+            raise ValueError('device_commands must map device types to commands')
+        mapping = {str(device_type).strip().lower(): parse_commands(commands)
+                   for device_type, commands in device_commands.items()}
+        value_sequences = [mapping.get(value.lower(), []) for value in values]
+    
+    groups = {}
+    # The trailing -1 maps blank cells (code -1) to "no sequence"
+    lookup = np.array([groups.setdefault(tuple(sequence), len(groups)) if sequence else -1
+                       for sequence in value_sequences] + [-1], dtype=np.int32)
+    codes = lookup[load_upload_field(meta['upload_id'], field)]
+    
+    missing = codes < 0
+    if missing.any():
+        if not fallback:
+            unmapped = ''
+            if command_source == 'device_type':
+                unmapped = ': ' + ', '.join(sorted({value for value, sequence in zip(values, value_sequences)
+                                                    if not sequence}))
+            raise ValueError(f'{int(missing.sum())} IMEIs have no command and no fallback command was given'
+                             f'{unmapped}')
+        codes[missing] = groups.setdefault(tuple(fallback), len(groups))
+    
+    return CommandPlan(imei_list, [list(sequence) for sequence in groups], codes)
+
+class RunActiveError(Exception):
+    """Raised when another job is still sending for the same run"""
+
+def start_send_job(plan, report_format, run_id=None, verify_timeout=None):
+    """Start a journaled send job for a CommandPlan and return the job record.
+
+    With run_id, continue that run's journal instead: the plan is read from
+    the journal (any passed in is ignored) and None is returned when every
+    IMEI has been accepted. Raises RunActiveError while another job of the
+    run is live. With a verify_timeout the returned command ids are followed
+    to delivery and the report combines send and delivery status.
+    """
+    job_id = str(uuid.uuid4())
+    run_id = run_id or job_id
+    # The run's .active file names the job sending it. Its lock is held from
+    # the check through start_job, so two resumes cannot both pass the check
+    # or read the journal before the other's sends are recorded.
+    with open(os.path.join(SEND_JOURNAL_DIR, f'{run_id}.active'), 'a+') as claim:
+        fcntl.flock(claim, fcntl.LOCK_EX)
+        claim.seek(0)
+        active = load_job_state(claim.read().strip())
+        if active and job_is_live(active):
+            raise RunActiveError(f"Job {active['job_id']} is still sending this run")
         
-        except requests.exceptions.RequestException as e:
-            error_msg = f"Request failed: {str(e)}"
-            logger.error(error_msg)
-            for imei in batch_imeis:
-                results.append({
-                    "IMEI": imei,
-                    "Command": command,
-                    "Status": "Error",
-                    "Response": error_msg,
-                    "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-        except Exception as e:
-            error_msg = f"Unexpected error: {str(e)}"
-            logger.error(error_msg)
-            for imei in batch_imeis:
-                results.append({
-                    "IMEI": imei,
-                    "Command": command,
-                    "Status": "Error",
-                    "Response": error_msg,
-                    "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-    
-    output = io.BytesIO()
-    df = pd.DataFrame(results)
-    df.to_excel(output, index=False)
-    output.seek(0)
+        if run_id == job_id:
+            journal = SendJournal.create(run_id, plan)
+        else:
+            journal = SendJournal(run_id)
+            plan = journal.remaining()
+            if not len(plan):
+                return None
+        if verify_timeout is not None:
+            verifier = SendVerifier(plan, journal, VERIFY_DELAY, verify_timeout)
+            job = start_job('send_command', plan.imeis, verifier, send_controller, 'command_results',
+                            report_format, job_id=job_id, run_id=run_id, watch=verifier, plan=plan)
+        else:
+            batches = dispatch_batches(plan.imeis,
+                                       lambda batch: send_batch(batch, plan.commands_for(batch), journal),
+                                       send_controller, pack=plan.pack)
+            job = start_job('send_command', plan.imeis, batches, send_controller, 'command_results',
+                            report_format, job_id=job_id, run_id=run_id, plan=plan)
+        claim.seek(0)
+        claim.truncate()
+        claim.write(job_id)
+    return job
+
+@bp.route('/api/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    """Re-dispatch only the failed or unsent batches of a send run"""
+    job = load_job_state(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['kind'] != 'send_command':
+        return jsonify({'error': 'Only send_command jobs can be resumed'}), 400
     
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=f'command_results_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-    )
+    if job_is_live(job):
+        return jsonify({'error': 'Job is still running'}), 409
+    
+    report_format = job.get('format', 'xlsx')
+    if request.is_json:
+        report_format = request.get_json().get('format', report_format)
+    if report_format not in REPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format. Use one of: {", ".join(REPORT_FORMATS)}'}), 400
+    
+    # A verified run stays verified when resumed
+    verify_timeout = job['watch']['timeout'] if job.get('watch') else None
+    try:
+        resumed = start_send_job(None, report_format, run_id=job.get('run_id', job_id),
+                                 verify_timeout=verify_timeout)
+    except RunActiveError as e:
+        return jsonify({'error': str(e)}), 409
+    except (OSError, ValueError):
+        return jsonify({'error': 'No journal found for this job'}), 404
+    
+    if resumed is None:
+        return jsonify({'job_id': None, 'remaining_imeis': 0, 'message': 'All batches already accepted'})
+    return jsonify({
+        'job_id': resumed['job_id'],
+        'total_batches': resumed['total_batches'],
+        'remaining_imeis': resumed['total_imeis']
+    }), 202
 
-@app.route('/check_status', methods=['GET'])
+@bp.route('/check_status', methods=['GET'])
 def check_status_page():
     session.permanent = True
-    if not get_imei_data():
-        return redirect(url_for('index'))
+    if not get_upload_meta():
+        return redirect(url_for('.index'))
     return render_template('check_status.html')
 
-@app.route('/api/check_status', methods=['POST'])
+def status_row(imei, status, message):
+    """Report row for an IMEI without a matching command"""
+    return {
+        "IMEI": imei,
+        "Sent Command": "N/A",
+        "Status": status,
+        "Message": message,
+        "Created": None,
+        "Updated": None,
+        "Requested By": "N/A",
+        "Device Type": "N/A",
+        "Bee Number": "N/A"
+    }
+
+class StatusAPIError(Exception):
+    """Non-200 response from the bee_commands endpoint"""
+
+def build_status_rbql(batch_imeis, start_epoch, end_epoch, page_num, updated_since=None):
+    filters = [
+        {"name": "imei", "values": batch_imeis, "op": "in"},
+        {"name": "created_date", "op": "gte", "value": start_epoch},
+        {"name": "created_date", "op": "lte", "value": end_epoch},
+        {"name": "imei", "isNull": False},
+        {"name": "imei", "value": " ", "op": "ne"}
+    ]
+    if updated_since is None:
+        filters.append({"name": "state", "values": [5], "op": "ne"})
+    else:
+        # Incremental syncs keep state 5 rows so the index sees those transitions
+        filters.append({"name": "updated_date", "op": "gte", "value": updated_since})
+    
+    return {
+        "pagination": {"page_size": STATUS_PAGE_SIZE, "page_num": page_num},
+        "filters": filters,
+        "sort": [{"name": "created_date", "order": "desc"}],
+        "joins": [
+            {
+                "join_type": "left_join",
+                "table_name": "bees",
+                "left_table_attribute": "imei",
+                "right_table_attribute": "imei",
+                "fields": [
+                    {"name": "bee_number", "readable_key": "Bee Number"},
+                    {"name": "device_type", "readable_key": "Device Type"},
+                    {"name": "uuid", "readable_key": "Bee UUID"}
+                ],
+                "filters": [
+                    {"value": 1, "name": "active", "table_name": "bees"}
+                ]
+            },
+            {
+                "join_type": "left_join",
+                "table_name": "users",
+                "left_table_attribute": "request_by",
+                "right_table_attribute": "id",
+                "table_alias": "request_by",
+                "fields": [
+                    {"name": "first_name", "readable_key": "Created By First Name"},
+                    {"name": "last_name", "readable_key": "Created By Last Name"}
+                ]
+            }
+        ]
+    }
+
+class StatusQuery:
+    """bee_commands request URL with the static RBQL serialized and encoded once.
+
+    The query is built from build_status_rbql() with placeholders, then
+    URL-encoded and split around them. Per request only the IMEI list,
+    created_date bounds, page number and optional updated_date bound are
+    spliced in.
+    """
+
+    PLACEHOLDER = re.compile(r'%22__(IMEIS|START|END|PAGE|UPDATED)__%22')
+
+    def __init__(self, incremental):
+        rbql = build_status_rbql(['__IMEIS__'], '__START__', '__END__', '__PAGE__',
+                                 '__UPDATED__' if incremental else None)
+        encoded = quote(json.dumps(rbql, separators=(',', ':')))
+        self.parts = self.PLACEHOLDER.split(encoded)
+        # Widest possible non-IMEI values, so packing never overshoots
+        self.base_length = len(self.url([], 10 ** 10, 10 ** 10, 10 ** 6, 10 ** 10))
+
+    def url(self, batch_imeis, start_epoch, end_epoch, page_num, updated_since=None):
+        values = {
+            'IMEIS': quote(json.dumps(batch_imeis, separators=(',', ':'))[1:-1]),
+            'START': str(start_epoch),
+            'END': str(end_epoch),
+            'PAGE': str(page_num),
+            'UPDATED': str(updated_since)
+        }
+        # split() alternates literal text and placeholder names
+        encoded = ''.join(part if i % 2 == 0 else values[part] for i, part in enumerate(self.parts))
+        return f"{STATUS_BASE_URL}?rbql={encoded}&isResellerAdmin=true"
+
+    def pack(self, items, position, limit):
+        """End index of the largest batch from `position` that keeps the URL
+        within MAX_STATUS_URL_LENGTH, capped at `limit` IMEIs"""
+        length = self.base_length
+        end = position
+        while end < len(items) and end - position < limit:
+            # Quoted IMEI plus its comma separator
+            length += len(quote(json.dumps(items[end]))) + 3
+            if length > MAX_STATUS_URL_LENGTH and end > position:
+                break
+            end += 1
+        return end
+
+status_queries = {False: StatusQuery(False), True: StatusQuery(True)}
+
+def fetch_status_page(batch_imeis, start_epoch, end_epoch, page_num, updated_since=None):
+    """Fetch one page of bee_commands; returns (total, rows)"""
+    url = status_queries[updated_since is not None].url(
+        batch_imeis, start_epoch, end_epoch, page_num, updated_since)
+    
+    response = status_controller.call('GET', url, headers=STATUS_HEADERS, timeout=30)
+    
+    if response.status_code != 200:
+        raise StatusAPIError(f"API Error: {response.status_code} - {response.text[:100]}")
+    
+    data = response.json()
+    if not isinstance(data, dict) or data.get("total", 0) <= 0:
+        return 0, []
+    return data["total"], data["data"]
+
+def build_command_id_rbql(command_ids, page_num):
+    """bee_commands lookup by command id: no date window, sort or joins"""
+    return {
+        "pagination": {"page_size": STATUS_PAGE_SIZE, "page_num": page_num},
+        "filters": [{"name": "id", "values": command_ids, "op": "in"}]
+    }
+
+def command_id_url(command_ids, page_num):
+    rbql = build_command_id_rbql(command_ids, page_num)
+    return f"{STATUS_BASE_URL}?rbql={quote(json.dumps(rbql, separators=(',', ':')))}&isResellerAdmin=true"
+
+def pack_command_ids(items, position, limit):
+    """End index of the largest id batch from `position` that keeps the URL
+    within MAX_STATUS_URL_LENGTH, capped at `limit` and one page of ids"""
+    length = len(command_id_url([], 10 ** 6))
+    end = position
+    while end < len(items) and end - position < min(limit, STATUS_PAGE_SIZE):
+        # The id plus its encoded comma separator
+        length += len(str(items[end])) + 3
+        if length > MAX_STATUS_URL_LENGTH and end > position:
+            break
+        end += 1
+    return end
+
+def fetch_commands_by_id(command_ids):
+    """Every bee_commands row for the given command ids"""
+    rows = []
+    page_num = 1
+    while True:
+        response = status_controller.call('GET', command_id_url(command_ids, page_num),
+                                          headers=STATUS_HEADERS, timeout=30)
+        if response.status_code != 200:
+            raise StatusAPIError(f"API Error: {response.status_code} - {response.text[:100]}")
+        data = response.json()
+        if not isinstance(data, dict) or data.get("total", 0) <= 0:
+            return rows
+        rows.extend(data["data"])
+        if page_num * STATUS_PAGE_SIZE >= data["total"]:
+            return rows
+        page_num += 1
+
+def time_shards(start_epoch, end_epoch, shard_count):
+    """Split [start_epoch, end_epoch] into shard_count contiguous windows"""
+    width = ceil((end_epoch - start_epoch + 1) / shard_count)
+    return [(shard_start, min(shard_start + width - 1, end_epoch))
+            for shard_start in range(start_epoch, end_epoch + 1, width)]
+
+def fetch_status_rows(batch_imeis, start_epoch, end_epoch, updated_since=None):
+    """Fetch every bee_commands row for a batch, newest first.
+
+    The first page gives the total. If more pages exist and the window is
+    wider than STATUS_SHARD_SECONDS, the part of the window older than the
+    first page is split into time shards that are queried concurrently; the
+    remaining pages of every shard are then fetched concurrently as well.
+    With `updated_since`, only rows updated at or after that epoch are
+    returned, including state 5 rows.
+    """
+    total, first_rows = fetch_status_page(batch_imeis, start_epoch, end_epoch, 1, updated_since)
+    page_count = ceil(total / STATUS_PAGE_SIZE)
+    if page_count <= 1:
+        return first_rows
+    
+    # Pages are newest first, so the first page holds every row newer than
+    # its oldest one; ties with that row are fetched again and deduplicated
+    oldest = min((command_data["created_date"] for command_data in first_rows
+                  if command_data.get("created_date") is not None), default=end_epoch)
+    shard_count = min(page_count - 1, ceil((oldest - start_epoch + 1) / STATUS_SHARD_SECONDS))
+    if shard_count > 1:
+        shards = time_shards(start_epoch, oldest, shard_count)
+        first_pages = list(get_page_executor().map(in_current_context(
+            lambda shard: fetch_status_page(batch_imeis, shard[0], shard[1], 1, updated_since)), shards))
+        pages = [first_rows]
+    else:
+        shards = [(start_epoch, end_epoch)]
+        first_pages = [(total, first_rows)]
+        pages = []
+    
+    rest = []
+    for (shard_start, shard_end), (shard_total, _) in zip(shards, first_pages):
+        for page_num in range(2, ceil(shard_total / STATUS_PAGE_SIZE) + 1):
+            rest.append((shard_start, shard_end, page_num))
+    rest_pages = get_page_executor().map(in_current_context(
+        lambda page: fetch_status_page(batch_imeis, *page, updated_since)), rest)
+    
+    rows = []
+    seen_ids = set()
+    pages += [page_rows for _, page_rows in first_pages + list(rest_pages)]
+    for page_rows in pages:
+        for command_data in page_rows:
+            command_id = command_data.get("id")
+            if command_id is not None:
+                if command_id in seen_ids:
+                    continue
+                seen_ids.add(command_id)
+            rows.append(command_data)
+    
+    rows.sort(key=lambda command_data: command_data.get("created_date") or 0, reverse=True)
+    return rows
+
+class CommandIndex:
+    """Local SQLite copy of bee_commands rows keyed by IMEI and command id.
+
+    `sync_windows` records, per IMEI, the created_date range held locally and
+    when it was last synced, so later checks only pull rows updated since.
+    Connections are per thread; SQLite's own locking covers other workers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def connect(self):
+        """This thread's connection, creating the index schema when it is opened"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""CREATE TABLE IF NOT EXISTS bee_commands (
+                    imei TEXT NOT NULL,
+                    command_id TEXT NOT NULL,
+                    created_date INTEGER,
+                    updated_date INTEGER,
+                    state INTEGER,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (imei, command_id))""")
+                conn.execute("""CREATE INDEX IF NOT EXISTS bee_commands_created
+                    ON bee_commands (imei, created_date)""")
+                conn.execute("""CREATE TABLE IF NOT EXISTS sync_windows (
+                    imei TEXT PRIMARY KEY,
+                    start_epoch INTEGER NOT NULL,
+                    end_epoch INTEGER NOT NULL,
+                    synced_at INTEGER NOT NULL)""")
+            self.local.conn = conn
+        return conn
+
+    def coverage(self, imeis):
+        """Return {imei: (start_epoch, end_epoch, synced_at)} for indexed IMEIs"""
+        placeholders = ','.join('?' * len(imeis))
+        rows = self.connect().execute(
+            f"SELECT imei, start_epoch, end_epoch, synced_at FROM sync_windows WHERE imei IN ({placeholders})",
+            list(imeis))
+        return {imei: (start_epoch, end_epoch, synced_at) for imei, start_epoch, end_epoch, synced_at in rows}
+
+    def upsert(self, rows):
+        values = []
+        for command_data in rows:
+            command_id = command_data.get("id")
+            if command_id is None:
+                command_id = f"{command_data.get('created_date')}:{command_data.get('msg')}"
+            values.append((str(command_data.get("imei")), str(command_id),
+                           command_data.get("created_date"), command_data.get("updated_date"),
+                           command_data.get("state"), json.dumps(command_data)))
+        with self.connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO bee_commands VALUES (?, ?, ?, ?, ?, ?)", values)
+
+    def replace_window(self, imeis, start_epoch, end_epoch, rows):
+        """Drop local rows for the IMEIs in the window, then store a full fetch"""
+        placeholders = ','.join('?' * len(imeis))
+        with self.connect() as conn:
+            conn.execute(
+                f"DELETE FROM bee_commands WHERE imei IN ({placeholders}) AND created_date BETWEEN ? AND ?",
+                list(imeis) + [start_epoch, end_epoch])
+        self.upsert(rows)
+
+    def mark_synced(self, imeis, start_epoch, end_epoch, synced_at):
+        with self.connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO sync_windows VALUES (?, ?, ?, ?)",
+                             [(imei, start_epoch, end_epoch, synced_at) for imei in imeis])
+
+    def live_bytes(self):
+        """Bytes in pages holding data; deleted rows free pages for reuse rather than shrinking the file"""
+        conn = self.connect()
+        page_size, = conn.execute("PRAGMA page_size").fetchone()
+        page_count, = conn.execute("PRAGMA page_count").fetchone()
+        free_pages, = conn.execute("PRAGMA freelist_count").fetchone()
+        return (page_count - free_pages) * page_size
+
+    def drop(self, imeis):
+        with self.connect() as conn:
+            for position in range(0, len(imeis), INDEX_PRUNE_CHUNK):
+                chunk = imeis[position:position + INDEX_PRUNE_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                conn.execute(f"DELETE FROM bee_commands WHERE imei IN ({placeholders})", chunk)
+                conn.execute(f"DELETE FROM sync_windows WHERE imei IN ({placeholders})", chunk)
+
+    def prune(self, synced_before, max_bytes, in_use_since):
+        """Drop IMEIs last synced before `synced_before`, then the least
+        recently synced while live data exceeds max_bytes, sparing any
+        synced since `in_use_since`. Returns the (expired, over budget) counts.
+        """
+        conn = self.connect()
+        expired = [imei for imei, in conn.execute(
+            "SELECT imei FROM sync_windows WHERE synced_at < ?", (synced_before,))]
+        self.drop(expired)
+        over_budget = 0
+        while self.live_bytes() > max_bytes:
+            oldest = [imei for imei, in conn.execute(
+                "SELECT imei FROM sync_windows WHERE synced_at < ? ORDER BY synced_at LIMIT ?",
+                (in_use_since, INDEX_PRUNE_CHUNK))]
+            if not oldest:
+                break
+            self.drop(oldest)
+            over_budget += len(oldest)
+        return len(expired), over_budget
+
+    def query(self, imeis, start_epoch, end_epoch):
+        """Indexed rows for the IMEIs in the window, newest first, excluding state 5"""
+        placeholders = ','.join('?' * len(imeis))
+        rows = self.connect().execute(
+            f"""SELECT data FROM bee_commands
+                WHERE imei IN ({placeholders}) AND created_date BETWEEN ? AND ?
+                AND (state IS NULL OR state != 5)
+                ORDER BY created_date DESC""",
+            list(imeis) + [start_epoch, end_epoch])
+        return [json.loads(data) for data, in rows]
+
+command_index = CommandIndex(COMMAND_INDEX_PATH) if COMMAND_INDEX_PATH else None
+
+def indexed_status_rows(batch_imeis, start_epoch, end_epoch, refresh=False):
+    """Status rows for a batch from the local index, syncing it with at most two queries"""
+    if command_index is None:
+        return fetch_status_rows(batch_imeis, start_epoch, end_epoch)
+    
+    sync_started = int(time.time())
+    coverage = {} if refresh else command_index.coverage(batch_imeis)
+    indexed = [imei for imei in batch_imeis if imei in coverage]
+    fresh = [imei for imei in batch_imeis if imei not in coverage]
+    common_start = max((coverage[imei][0] for imei in indexed), default=None)
+    common_end = min((coverage[imei][1] for imei in indexed), default=None)
+    gap = None
+    if indexed and common_start > start_epoch:
+        gap = (start_epoch, common_start - 1)
+    elif indexed and common_end < end_epoch:
+        gap = (common_end + 1, end_epoch)
+    
+    if (not indexed or common_start > min(common_end, end_epoch) or common_end < start_epoch
+            or (common_start > start_epoch and common_end < end_epoch) or (gap and fresh)):
+        command_index.replace_window(batch_imeis, start_epoch, end_epoch,
+                                     fetch_status_rows(batch_imeis, start_epoch, end_epoch))
+        command_index.mark_synced(batch_imeis, start_epoch, end_epoch, sync_started)
+        return command_index.query(batch_imeis, start_epoch, end_epoch)
+    
+    synced_at = min(coverage[imei][2] for imei in indexed)
+    command_index.upsert(fetch_status_rows(indexed, common_start, common_end,
+                                           updated_since=synced_at - INDEX_SYNC_SKEW_SECONDS))
+    if gap:
+        command_index.replace_window(indexed, *gap, fetch_status_rows(indexed, *gap))
+    command_index.mark_synced(indexed, min(start_epoch, common_start), max(end_epoch, common_end), sync_started)
+    if fresh:
+        command_index.replace_window(fresh, start_epoch, end_epoch,
+                                     fetch_status_rows(fresh, start_epoch, end_epoch))
+        command_index.mark_synced(fresh, start_epoch, end_epoch, sync_started)
+    
+    return command_index.query(batch_imeis, start_epoch, end_epoch)
+
+def status_batch(batch_imeis, start_epoch, end_epoch, bulk_check, refresh=False, summary=False):
+    """Query bee_commands for one IMEI batch and return its report rows,
+    or with `summary` only their StatusCounts"""
+    failure = None
+    try:
+        commands = indexed_status_rows(batch_imeis, start_epoch, end_epoch, refresh)
+        started = time.perf_counter()
+        if summary:
+            results = count_status_rows(batch_imeis, commands, bulk_check)
+        else:
+            results = build_status_rows(batch_imeis, commands, bulk_check)
+        record_timing('post_process', time.perf_counter() - started, kind='status')
+    except CircuitOpenError as e:
+        failure = ("Skipped", str(e))
+    except StatusAPIError as e:
+        failure = ("Error", str(e))
+    except (ValueError, KeyError) as e:
+        failure = ("Error", f"Invalid response format: {str(e)}")
+    except Exception as e:
+        failure = ("Error", str(e))
+    
+    if summary:
+        if failure:
+            results = StatusCounts(len(batch_imeis), Counter({(failure[0], "N/A", "N/A"): len(batch_imeis)}))
+        return results
+    if failure:
+        results = RowBatch.from_records([status_row(imei, *failure) for imei in batch_imeis])
+    results.set_constant("Batch Size", len(batch_imeis))
+    results.set_constant("Request Rate", round(status_controller.rate, 2))
+    return results
+
+def build_status_rows(batch_imeis, commands, bulk_check):
+    """Turn one batch of bee_commands rows (newest first) into a RowBatch.
+
+    The payload is converted to columns once and every field is derived
+    with vectorized operations. Rows come back grouped in batch IMEI order,
+    with a Not Found row for each IMEI that has no commands.
+    """
+    order = {imei: position for position, imei in enumerate(batch_imeis)}
+    frame = command_frame(batch_imeis, commands, bulk_check)
+    
+    def column(name, default):
+        return frame_column(frame, name, default)
+    
+    device_type = payload_values(frame, 'bees__device_type', 'N/A')
+    report = pd.DataFrame({
+        "IMEI": frame['imei'],
+        "Sent Command": decode_at_commands(column('msg', 'N/A'), device_type),
+        "Status": state_labels(column('state', -1)),
+        "Message": payload_values(frame, 'error_message', ''),
+        "Created": pd.to_numeric(column('created_date', None), errors='coerce'),
+        "Updated": pd.to_numeric(column('updated_date', None), errors='coerce'),
+        "Requested By": requesters(frame),
+        "Device Type": device_type,
+        "Bee Number": payload_values(frame, 'bees__bee_number', 'N/A')
+    }, index=frame.index)
+    
+    # Not Found rows are appended to the column lists rather than concatenated
+    # as a frame, so their all-null columns cannot change the report's dtypes
+    columns = {col: report[col].tolist() for col in report.columns}
+    found = set(columns["IMEI"])
+    for imei in batch_imeis:
+        if imei not in found:
+            for col, value in status_row(imei, "Not Found", "No commands in date range").items():
+                columns[col].append(value)
+    
+    positions = np.argsort([order[imei] for imei in columns["IMEI"]], kind='stable')
+    return RowBatch.compact({col: [values[i] for i in positions] for col, values in columns.items()})
+
+def count_status_rows(batch_imeis, commands, bulk_check):
+    """StatusCounts for one batch of bee_commands rows, for summary-only checks.
+
+    Rows are grouped on their raw state, device type and requester fields,
+    and only the distinct groups get the report's labels.
+    """
+    frame = command_frame(batch_imeis, commands, bulk_check)
+    counts = Counter()
+    keys = [name for name in SUMMARY_FIELDS if name in frame]
+    if len(frame):
+        if keys:
+            sizes = frame.groupby(keys, dropna=False, sort=False).size()
+            groups, sizes = sizes.index.to_frame(index=False), sizes.tolist()
+        else:
+            # None of the fields is present, so every row gets the same labels
+            groups, sizes = frame.iloc[:1], [len(frame)]
+        labels = zip(state_labels(frame_column(groups, 'state', -1)),
+                     payload_values(groups, 'bees__device_type', 'N/A'), requesters(groups), sizes)
+        for status, device_type, requester, count in labels:
+            counts[(status, device_type, requester)] += count
+    
+    missing = len(set(batch_imeis)) - frame['imei'].nunique()
+    if missing:
+        counts[("Not Found", "N/A", "N/A")] += missing
+    return StatusCounts(len(set(batch_imeis)), counts)
+
+# Payload fields that decide a row's status, device type and requester
+SUMMARY_FIELDS = ('state', 'bees__device_type', 'request_by', 'request_by__first_name', 'request_by__last_name')
+
+def command_frame(batch_imeis, commands, bulk_check):
+    """bee_commands rows for the batch as a DataFrame; only the newest per IMEI unless bulk_check"""
+    frame = pd.DataFrame(commands)
+    if frame.empty:
+        frame = pd.DataFrame({'imei': pd.Series(dtype=object)})
+    frame = frame[frame['imei'].isin(list(batch_imeis))]
+    if not bulk_check:
+        frame = frame.drop_duplicates('imei', keep='first')
+    return frame
+
+def frame_column(frame, name, default):
+    if name in frame:
+        return frame[name]
+    return pd.Series(default, index=frame.index, dtype=object)
+
+STATE_LABELS = {
+    0: "Pending",
+    1: "Sent",
+    2: "Acknowledged",
+    3: "Completed",
+    4: "Failed",
+    5: "Failed"
+}
+
+def state_labels(states):
+    """Map bee_commands state codes to report labels; a null state is "Unknown state (None)" """
+    states = pd.to_numeric(states, errors='coerce')
+    labels = states.map(STATE_LABELS)
+    unknown = labels.isna()
+    if unknown.any():
+        codes = states[unknown]
+        labels[unknown] = "Unknown state (" + payload_text(codes) + ")"
+    return labels
+
+HEX_COMMAND_DEVICE_TYPES = ("BSFlex", "BSMax", "BeeLabel", "BeeAssetFit")
+
+def decode_at_commands(messages, device_types):
+    """Sent Command column: hex payloads from BSFlex/BSMax/BeeLabel/BeeAssetFit
+    devices are decoded once per distinct message; others pass through"""
+    messages = messages.where(messages.notna() & (messages != ''), "N/A")
+    hex_rows = device_types.isin(HEX_COMMAND_DEVICE_TYPES) & (messages != "N/A")
+    if hex_rows.any():
+        messages = messages.copy()
+        messages[hex_rows] = messages[hex_rows].map(extract_at_command)
+    return messages
+
+def epochs_to_dates(epochs):
+    """Format epoch seconds as local 'YYYY-MM-DD HH:MM:SS', "N/A" when missing.
+
+    The local UTC offset is looked up once per distinct hour, so DST
+    transitions are honoured without a per-row datetime call.
+    """
+    epochs = pd.to_numeric(epochs, errors='coerce')
+    dates = pd.Series("N/A", index=epochs.index, dtype=object)
+    valid = epochs.notna()
+    if valid.any():
+        seconds = epochs[valid].astype(np.int64).to_numpy()
+        hours, position = np.unique(seconds // 3600, return_inverse=True)
+        offsets = np.array([time.localtime(hour * 3600).tm_gmtoff for hour in hours.tolist()])
+        local = (seconds + offsets[position]).astype('datetime64[s]')
+        dates[valid] = np.char.replace(np.datetime_as_string(local, unit='s'), 'T', ' ')
+    return dates
+
+def requesters(frame):
+    """Requested By column: "first last" when the payload has the joined name
+    fields, else the raw request_by id, else "Unknown". As in the per-row
+    code, a field counts when present even if null, and nulls print as None.
+    """
+    if 'request_by__first_name' in frame and 'request_by__last_name' in frame:
+        return payload_text(frame['request_by__first_name']) + " " + payload_text(frame['request_by__last_name'])
+    if 'request_by' in frame:
+        return payload_text(frame['request_by'])
+    return pd.Series("Unknown", index=frame.index, dtype=object)
+
+def payload_text(values):
+    """str() of each payload value, with nulls as "None" """
+    if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+        # A null among integer ids makes the column float
+        values = values.astype('Int64')
+    return values.astype(object).where(values.notna(), "None").astype(str)
+
+def payload_values(frame, name, default):
+    """A payload field as report values: nulls stay None, as dict.get gave
+    them per row, and `default` is used when the payload lacks the field"""
+    if name not in frame:
+        return pd.Series(default, index=frame.index, dtype=object)
+    values = frame[name].astype(object)
+    return values.where(values.notna(), None)
+
+@bp.route('/api/check_status', methods=['POST'])
 def check_status():
+    """Start a background status check and return its job ID"""
     session.permanent = True
     
-    # Get IMEIs from temp file
-    imei_data = get_imei_data()
-    if not imei_data or not imei_data.get('imei_list'):
+    # Get upload metadata from temp file
+    meta = get_upload_meta()
+    if not meta or not meta.get('imei_count'):
         return jsonify({'error': 'No IMEI list found'}), 400
     
     if not request.is_json:
@@ -312,10 +2038,30 @@ def check_status():
     start_date = data.get('start_date')
     end_date = data.get('end_date')
     bulk_check = data.get('bulk_check', False)
+    refresh = data.get('refresh', False)
+    mode = data.get('mode', 'report')
+    report_format = data.get('format', 'xlsx')
     
     if not start_date or not end_date:
         return jsonify({'error': 'Both start_date and end_date are required'}), 400
     
+    if mode not in ('report', 'summary', 'watch'):
+        return jsonify({'error': 'Mode must be "report", "summary" or "watch"'}), 400
+    
+    try:
+        watch_interval = float(data.get('watch_interval', WATCH_INTERVAL))
+        watch_timeout = float(data.get('watch_timeout', WATCH_TIMEOUT))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'watch_interval and watch_timeout must be numbers of seconds'}), 400
+    if mode == 'watch' and not (0 < watch_interval and 0 < watch_timeout <= WATCH_MAX_TIMEOUT):
+        return jsonify({'error': f'watch_interval must be positive and watch_timeout at most {WATCH_MAX_TIMEOUT:g}s'}), 400
+    
+    if mode == 'summary':
+        # Aggregates only; batches are counted without building report rows
+        report_format = None
+    elif report_format not in REPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format. Use one of: {", ".join(REPORT_FORMATS)}'}), 400
+    
     try:
         start_epoch = int(time.mktime(datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S").timetuple()))
         end_epoch = int(time.mktime(datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S").timetuple()))
@@ -325,271 +2071,841 @@ def check_status():
     if start_epoch > end_epoch:
         return jsonify({'error': 'Start date must be before end date'}), 400
     
-    imei_list = imei_data['imei_list']
-    results = []
-    total_imeis = len(imei_list)
-    total_batches = ceil(total_imeis / BATCH_SIZE)
-    
-    status_counts = {
-        "completed": 0,
-        "pending": 0,
-        "sent": 0,
-        "acknowledged": 0,
-        "failed": 0,
-        "not_found": 0
-    }
+    imei_list = load_imei_list(meta['upload_id'])
+    if mode == 'watch':
+        watch = StatusWatch(imei_list, start_epoch, end_epoch, bulk_check, refresh, watch_interval, watch_timeout)
+        job = start_job('check_status', imei_list, watch, status_controller, 'status_results', report_format,
+                        summary=StatusSummary(), watch=watch)
+        return jsonify({'job_id': job['job_id'], 'total_batches': job['total_batches']}), 202
     
-    for batch_num in range(total_batches):
-        start_idx = batch_num * BATCH_SIZE
-        end_idx = min((batch_num + 1) * BATCH_SIZE, total_imeis)
-        batch_imeis = imei_list[start_idx:end_idx]
+    batches = dispatch_batches(imei_list,
+                               lambda batch: status_batch(batch, start_epoch, end_epoch, bulk_check, refresh,
+                                                          summary=mode == 'summary'),
+                               status_controller, pack=status_queries[False].pack)
+    job = start_job('check_status', imei_list, batches, status_controller, 'status_results', report_format,
+                    summary=StatusSummary())
+    
+    return jsonify({'job_id': job['job_id'], 'total_batches': job['total_batches']}), 202
+
+TERMINAL_STATES = (3, 4, 5)
+TERMINAL_LABELS = {STATE_LABELS[state] for state in TERMINAL_STATES}
+
+class StatusWatch:
+    """Re-poll IMEIs until their latest command reaches a terminal state.
+
+    Each round queries only the IMEIs still pending, so query volume
+    shrinks as the fleet converges; the wait between rounds grows by
+    WATCH_BACKOFF up to WATCH_MAX_INTERVAL. The watch ends when nothing is
+    pending or the next round would start past the deadline. Iterating
+    yields an empty batch as a heartbeat after every batch of a round and
+    while waiting, then the last rows seen for every IMEI, in upload order,
+    as the final report.
+    """
+
+    unit = 'IMEIs'
+
+    def __init__(self, imei_list, start_epoch, end_epoch, bulk_check, refresh, interval, timeout):
+        self.imei_list = imei_list
+        self.start_epoch = start_epoch
+        self.end_epoch = end_epoch
+        self.bulk_check = bulk_check
+        self.refresh = refresh
+        self.interval = interval
+        self.deadline = time.time() + timeout
+        self.rounds = []
+        self.pending = len(imei_list)
+        # IMEIs answered so far in the current round
+        self.polled = 0
+        self.next_poll = None
+        self.outcome = None
+
+    def poll(self, imeis, refresh, latest):
+        """Query one round into `latest` as {imei: (batch, start, stop)}, the
+        IMEI's rows in that RowBatch, newest command first; yields a heartbeat
+        after every batch so a long round keeps the job state fresh"""
+        self.polled = 0
+        for batch in dispatch_batches(imeis,
+                                      lambda batch: status_batch(batch, self.start_epoch, self.end_epoch,
+                                                                 self.bulk_check, refresh),
+                                      status_controller, pack=status_queries[False].pack):
+            # status_batch keeps each IMEI's rows contiguous
+            batch_imeis = batch.column('IMEI')
+            start = 0
+            for stop in range(1, len(batch_imeis) + 1):
+                if stop == len(batch_imeis) or batch_imeis[stop] != batch_imeis[start]:
+                    latest[batch_imeis[start]] = (batch, start, stop)
+                    start = stop
+            self.polled = len(latest)
+            yield []
+
+    def __iter__(self):
+        latest = {}
+        pending = self.imei_list
+        interval = self.interval
+        while True:
+            polled = {}
+            yield from self.poll(pending, self.refresh and not self.rounds, polled)
+            latest.update(polled)
+            # Error and Not Found rows stay pending; the command may not be visible yet
+            pending = [imei for imei in pending
+                       if polled[imei][0].column('Status')[polled[imei][1]] not in TERMINAL_LABELS]
+            self.pending = len(pending)
+            self.rounds.append({'polled': len(polled), 'pending': len(pending),
+                                'finished': datetime.now().isoformat()})
+            logger.info(f"Watch round {len(self.rounds)}: polled {len(polled)}, {len(pending)} still pending")
+            
+            if not pending:
+                self.outcome = 'converged'
+                break
+            next_poll = time.time() + interval
+            if next_poll > self.deadline:
+                self.outcome = 'deadline'
+                break
+            self.next_poll = datetime.fromtimestamp(next_poll).isoformat()
+            yield []
+            # Heartbeats keep the job state fresh through long waits
+            while time.time() < next_poll:
+                time.sleep(min(WATCH_HEARTBEAT, max(0.0, next_poll - time.time())))
+                yield []
+            interval = min(WATCH_MAX_INTERVAL, interval * WATCH_BACKOFF)
         
+        self.next_poll = None
+        yield []
+        for position in range(0, len(self.imei_list), MAX_BATCH_SIZE):
+            yield RowBatch.concat([latest[imei][0].slice(*latest[imei][1:])
+                                   for imei in self.imei_list[position:position + MAX_BATCH_SIZE]])
+
+    def as_dict(self):
+        return {
+            'rounds': self.rounds,
+            'pending': self.pending,
+            'polled': self.polled,
+            'next_poll': self.next_poll,
+            'deadline': datetime.fromtimestamp(self.deadline).isoformat(),
+            'outcome': self.outcome
+        }
+
+class SendVerifier:
+    """Send a CommandPlan and follow the returned command ids to delivery.
+
+    send_batch() hands each accepted batch's ids to track(). Once a batch
+    is `interval` seconds old its ids are looked up by id on the page pool
+    while later batches are still sending. After the last send, ids not yet
+    in a terminal state are re-polled in rounds, backing off like
+    StatusWatch, until none are pending or the deadline (`timeout` after
+    the last send) passes. Iterating yields heartbeats, then one combined
+    send-and-delivery row per command id, in send order.
+    """
+
+    unit = 'commands'
+
+    def __init__(self, plan, journal, interval, timeout):
+        self.plan = plan
+        self.journal = journal
+        self.interval = interval
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # (due time, ids) per accepted batch not looked up yet
+        self.tracked = deque()
+        self.command_ids = []
+        # Command id -> (imei, state, error message, updated epoch)
+        self.states = {}
+        self.final = 0
+        self.sent_batches = []
+        self.sent = 0
+        self.accepted = 0
+        self.rounds = []
+        self.pending = 0
+        self.next_poll = None
+        self.deadline = None
+        self.outcome = None
+
+    def track(self, ids):
+        with self.lock:
+            self.tracked.append((time.time() + self.interval, list(ids)))
+            self.command_ids.extend(ids)
+            self.pending = len(self.command_ids) - self.final
+
+    def lookup(self, command_ids):
+        """bee_commands rows for some ids; failed lookups leave the ids pending"""
         try:
-            filters = [
-                {"name": "imei", "values": batch_imeis, "op": "in"},
-                {"name": "created_date", "op": "gte", "value": start_epoch},
-                {"name": "created_date", "op": "lte", "value": end_epoch},
-                {"name": "imei", "isNull": False},
-                {"name": "imei", "value": " ", "op": "ne"},
-                {"name": "state", "values": [5], "op": "ne"}
-            ]
-            
-            rbql = {
-                "pagination": {"page_size": 500, "page_num": 1},
-                "filters": filters,
-                "sort": [{"name": "created_date", "order": "desc"}],
-                "joins": [
-                    {
-                        "join_type": "left_join",
-                        "table_name": "bees",
-                        "left_table_attribute": "imei",
-                        "right_table_attribute": "imei",
-                        "fields": [
-                            {"name": "bee_number", "readable_key": "Bee Number"},
-                            {"name": "device_type", "readable_key": "Device Type"},
-                            {"name": "uuid", "readable_key": "Bee UUID"}
-                        ],
-                        "filters": [
-                            {"value": 1, "name": "active", "table_name": "bees"}
-                        ]
-                    },
-                    {
-                        "join_type": "left_join",
-                        "table_name": "users",
-                        "left_table_attribute": "request_by",
-                        "right_table_attribute": "id",
-                        "table_alias": "request_by",
-                        "fields": [
-                            {"name": "first_name", "readable_key": "Created By First Name"},
-                            {"name": "last_name", "readable_key": "Created By Last Name"}
-                        ]
-                    }
-                ]
-            }
-            
-            rbql_str = json.dumps(rbql, separators=(',', ':'))
-            rbql_encoded = quote(rbql_str)
-            url = f"{STATUS_BASE_URL}?rbql={rbql_encoded}&isResellerAdmin=true"
-            
-            headers = {
-                "Content-Type": "application/json",
-                "apikey": API_KEY,
-                "Accept": "application/json"
-            }
-            
-            response = requests.get(url, headers=headers, timeout=30)
-            
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    if isinstance(data, dict) and data.get("total", 0) > 0:
-                        imei_commands = {}
-                        for command_data in data["data"]:
-                            imei = command_data.get("imei")
-                            if imei not in imei_commands:
-                                imei_commands[imei] = []
-                            imei_commands[imei].append(command_data)
-                        
-                        for imei in batch_imeis:
-                            commands = imei_commands.get(imei, [])
-                            
-                            if not commands:
-                                status_counts["not_found"] += 1
-                                results.append({
-                                    "IMEI": imei,
-                                    "Sent Command": "N/A",
-                                    "Status": "Not Found",
-                                    "Message": "No commands in date range",
-                                    "Created": "N/A",
-                                    "Updated": "N/A",
-                                    "Requested By": "N/A",
-                                    "Device Type": "N/A",
-                                    "Bee Number": "N/A"
-                                })
-                                continue
-                            
-                            if not bulk_check:
-                                commands = [commands[0]]
-                            
-                            for cmd_idx, command_data in enumerate(commands):
-                                state = command_data.get("state", -1)
-                                
-                                if state == 3:
-                                    status_counts["completed"] += 1
-                                    status = "Completed"
-                                elif state in [4, 5]:
-                                    status_counts["failed"] += 1
-                                    status = "Failed"
-                                elif state == 0:
-                                    status_counts["pending"] += 1
-                                    status = "Pending"
-                                elif state == 1:
-                                    status_counts["sent"] += 1
-                                    status = "Sent"
-                                elif state == 2:
-                                    status_counts["acknowledged"] += 1
-                                    status = "Acknowledged"
-                                else:
-                                    status_counts["failed"] += 1
-                                    status = f"Unknown state ({state})"
-
-                                device_type = command_data.get("bees__device_type", "N/A")
-                                bee_number = command_data.get("bees__bee_number", "N/A")
-                                raw_command = command_data.get("msg", "N/A")
-                                at_command = extract_at_command(raw_command, device_type)
-                                
-                                results.append({
-                                    "IMEI": imei,
-                                    "Sent Command": at_command,
-                                    "Status": status,
-                                    "Message": command_data.get("error_message", ""),
-                                    "Created": epoch_to_date(command_data.get("created_date")),
-                                    "Updated": epoch_to_date(command_data.get("updated_date")),
-                                    "Requested By": get_requester(command_data),
-                                    "Device Type": device_type,
-                                    "Bee Number": bee_number
-                                })
-                    else:
-                        for imei in batch_imeis:
-                            status_counts["not_found"] += 1
-                            results.append({
-                                "IMEI": imei,
-                                "Sent Command": "N/A",
-                                "Status": "Not Found",
-                                "Message": "No commands in date range",
-                                "Created": "N/A",
-                                "Updated": "N/A",
-                                "Requested By": "N/A",
-                                "Device Type": "N/A",
-                                "Bee Number": "N/A"
-                            })
-                except (ValueError, KeyError) as e:
-                    for imei in batch_imeis:
-                        status_counts["failed"] += 1
-                        results.append({
-                            "IMEI": imei,
-                            "Sent Command": "N/A",
-                            "Status": "Error",
-                            "Message": f"Invalid response format: {str(e)}",
-                            "Created": "N/A",
-                            "Updated": "N/A",
-                            "Requested By": "N/A",
-                            "Device Type": "N/A",
-                            "Bee Number": "N/A"
-                        })
+            return fetch_commands_by_id(command_ids)
+        except (CircuitOpenError, StatusAPIError, requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Lookup of {len(command_ids)} command ids failed: {str(e)}")
+            return []
+
+    def submit_due(self, lookups):
+        """Start lookups on the page pool for every tracked batch that is due"""
+        now = time.time()
+        with self.lock:
+            due = []
+            while self.tracked and self.tracked[0][0] <= now:
+                due.extend(self.tracked.popleft()[1])
+        position = 0
+        while position < len(due):
+            end = pack_command_ids(due, position, STATUS_PAGE_SIZE)
+            lookups.append(get_page_executor().submit(in_current_context(self.lookup), due[position:end]))
+            position = end
+
+    def merge(self, rows):
+        for row in rows:
+            previous = self.states.get(row['id'], (None, None))
+            self.final += (row.get('state') in TERMINAL_STATES) - (previous[1] in TERMINAL_STATES)
+            self.states[row['id']] = (row.get('imei'), row.get('state'), row.get('error_message') or '',
+                                      row.get('updated_date'))
+        with self.lock:
+            self.pending = len(self.command_ids) - self.final
+
+    def pending_ids(self):
+        with self.lock:
+            command_ids = list(self.command_ids)
+        return [command_id for command_id in command_ids
+                if self.states.get(command_id, (None, None))[1] not in TERMINAL_STATES]
+
+    def __iter__(self):
+        lookups = []
+        for sent in dispatch_batches(self.plan.imeis,
+                                     lambda batch: send_batch(batch, self.plan.commands_for(batch),
+                                                              self.journal, self),
+                                     send_controller, pack=self.plan.pack):
+            self.sent_batches.append(sent)
+            self.sent += len(sent)
+            if sent.column("Status")[0] == "Success":
+                self.accepted += len(sent)
+            self.submit_due(lookups)
+            for future in [future for future in lookups if future.done()]:
+                lookups.remove(future)
+                self.merge(future.result())
+            yield []
+        for future in lookups:
+            self.merge(future.result())
+        
+        # Sends are done; whatever is still pending is polled in rounds
+        self.deadline = time.time() + self.timeout
+        with self.lock:
+            next_poll = max([due for due, _ in self.tracked] + [time.time()])
+            self.tracked.clear()
+        interval = self.interval
+        while True:
+            pending = self.pending_ids()
+            self.pending = len(pending)
+            if not pending:
+                self.outcome = 'converged'
+                break
+            if next_poll > self.deadline:
+                self.outcome = 'deadline'
+                break
+            self.next_poll = datetime.fromtimestamp(next_poll).isoformat()
+            while time.time() < next_poll:
+                time.sleep(min(WATCH_HEARTBEAT, max(0.0, next_poll - time.time())))
+                yield []
+            for rows in dispatch_batches(pending, self.lookup, status_controller, pack=pack_command_ids):
+                self.merge(rows)
+            self.rounds.append({'polled': len(pending), 'pending': self.pending,
+                                'finished': datetime.now().isoformat()})
+            logger.info(f"Verify round {len(self.rounds)}: polled {len(pending)}, {self.pending} still pending")
+            next_poll = time.time() + interval
+            interval = min(WATCH_MAX_INTERVAL, interval * WATCH_BACKOFF)
+        
+        self.next_poll = None
+        yield []
+        yield from self.report_rows()
+
+    def report_rows(self):
+        """One combined RowBatch per send batch"""
+        by_imei = {}
+        for command_id in sorted(self.states):
+            imei, state, message, updated = self.states[command_id]
+            by_imei.setdefault(imei, []).append((command_id, STATE_LABELS.get(state, f"Unknown state ({state})"),
+                                                 message, updated))
+        names = ("IMEI", "Command", "Send Status", "Response", "Sent At",
+                 "Command ID", "Status", "Message", "Updated")
+        for sent in self.sent_batches:
+            columns = {name: [] for name in names}
+            for send_values in zip(*(sent.column(name) for name in ("IMEI", "Command", "Status",
+                                                                       "Response", "Timestamp"))):
+                imei, status = send_values[0], send_values[2]
+                if status != "Success":
+                    commands = [("N/A", status, "", None)]
+                else:
+                    commands = by_imei.get(imei) or [("N/A", "Not Found", "Command ids not visible yet", None)]
+                for command in commands:
+                    for name, value in zip(names, send_values + command):
+                        columns[name].append(value)
+            yield RowBatch.compact(columns)
+
+    def as_dict(self):
+        return {
+            'sent': self.sent,
+            'accepted': self.accepted,
+            'commands': len(self.command_ids),
+            'rounds': self.rounds,
+            'pending': self.pending,
+            'next_poll': self.next_poll,
+            'deadline': datetime.fromtimestamp(self.deadline).isoformat() if self.deadline else None,
+            'timeout': self.timeout,
+            'outcome': self.outcome
+        }
+
+def job_state_path(job_id):
+    return os.path.join(TEMP_UPLOAD_DIR, f'{job_id}.job.json')
+
+def save_job_state(job):
+    """Persist job progress so any worker process can report on it"""
+    job['updated'] = datetime.now().isoformat()
+    temp_path = job_state_path(job['job_id']) + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(job, f)
+    os.replace(temp_path, job_state_path(job['job_id']))
+    if job.get('run_id'):
+        # The run's journal is then never older than its jobs, so the sweeper removes it last
+        try:
+            os.utime(os.path.join(SEND_JOURNAL_DIR, f"{job['run_id']}.active"))
+        except FileNotFoundError:
+            pass
+
+def load_job_state(job_id):
+    try:
+        uuid.UUID(job_id)
+        with open(job_state_path(job_id), 'r') as f:
+            return json.load(f)
+    except:
+        return None
+
+def job_is_live(job):
+    """True while a job is running; one whose worker died stays 'running' but stops updating"""
+    updated = datetime.fromisoformat(job['updated'])
+    return job['status'] == 'running' and (datetime.now() - updated).total_seconds() < JOB_STALE_SECONDS
+
+def start_job(kind, imei_list, batches, controller, report_prefix, report_format='xlsx',
+              job_id=None, run_id=None, summary=None, watch=None, plan=None):
+    """Run the batch iterator on a background thread and return the job record.
+
+    A report_format of None skips the per-row report; `summary`, if given,
+    aggregates rows as they stream in. With a `watch`, its state is saved
+    as the job's 'watch' field whenever the iterator yields. A send job
+    passes its CommandPlan so batch counts respect its sequence groups.
+    """
+    job = {
+        'job_id': job_id or str(uuid.uuid4()),
+        'kind': kind,
+        'run_id': run_id,
+        'status': 'running',
+        'total_imeis': len(imei_list),
+        'total_batches': estimate_batches(len(imei_list), 0, controller.batch_size, plan),
+        'batches_done': 0,
+        'imeis_processed': 0,
+        'errors': 0,
+        'batch_size': controller.batch_size,
+        'request_rate': controller.rate,
+        'status_counts': {},
+        'summary': summary.as_dict() if summary else None,
+        'watch': watch.as_dict() if watch else None,
+        'format': report_format,
+        'message': None,
+        'report_file': None,
+        'download_name': None,
+        'timings': {},
+        'created': datetime.now().isoformat()
+    }
+    save_job_state(job)
+    threading.Thread(target=run_job, args=(job, batches, controller, report_prefix, summary, watch, plan),
+                     daemon=True).start()
+    return job
+
+def estimate_batches(total, position, batch_size, plan=None):
+    """Batches still to run after `position` of `total` items"""
+    if plan is not None:
+        return plan.batch_count(position, batch_size)
+    return ceil((total - position) / batch_size)
+
+def run_job(job, batches, controller, report_prefix, summary=None, watch=None, plan=None):
+    if job['format']:
+        extension = REPORT_FORMATS[job['format']][0]
+        report_file = f"{job['job_id']}.{extension}"
+        writer = ReportWriter(os.path.join(TEMP_UPLOAD_DIR, report_file), job['format'])
+    else:
+        report_file = None
+        writer = NullReportWriter()
+    report_format = job['format'] or 'none'
+    timings = TimingBreakdown()
+    current_timings.set(timings)
+    current_job_id.set(job['job_id'])
+    try:
+        with writer:
+            for batch_results in batches:
+                if watch is not None:
+                    job['watch'] = watch.as_dict()
+                if not batch_results:
+                    # Heartbeat between watch rounds
+                    job['timings'] = timings.as_dict()
+                    save_job_state(job)
+                    continue
+                started = time.perf_counter()
+                writer.write_rows(batch_results)
+                record_timing('report', time.perf_counter() - started, format=report_format)
+                if summary is not None:
+                    summary.add(batch_results)
+                    job['summary'] = summary.as_dict()
+                job['batches_done'] += 1
+                job['imeis_processed'] += batch_results.imei_count()
+                for status, count in batch_results.status_counts().items():
+                    job['status_counts'][status] = job['status_counts'].get(status, 0) + count
+                    if status in ('Error', 'Failed'):
+                        job['errors'] += count
+                # Batch size adapts during the run, so the total is re-estimated
+                job['batch_size'] = controller.batch_size
+                job['request_rate'] = round(controller.rate, 2)
+                job['total_batches'] = job['batches_done'] + estimate_batches(
+                    job['total_imeis'], job['imeis_processed'], controller.batch_size, plan)
+                job['timings'] = timings.as_dict()
+                logger.info(f"Job {job['job_id']}: batch {job['batches_done']}/{job['total_batches']} done, "
+                            f"batch size {job['batch_size']}, {job['request_rate']} req/s")
+                save_job_state(job)
+            # Closing the writer (e.g. the xlsx save) counts as report time too
+            started = time.perf_counter()
+        record_timing('report', time.perf_counter() - started, format=report_format)
+        
+        job['report_seconds'] = timings.as_dict().get('report', 0.0)
+        if job['status_counts'].get('Skipped'):
+            job['message'] = (f"{job['status_counts']['Skipped']} rows skipped while the API was unavailable"
+                              + ("; resume the job to retry them" if job['kind'] == 'send_command' else ""))
+        if watch is not None:
+            job['watch'] = watch.as_dict()
+            if watch.outcome == 'deadline':
+                job['message'] = f'Deadline reached with {watch.pending} {watch.unit} still pending'
+        if report_file:
+            job['report_file'] = report_file
+            job['download_name'] = f'{report_prefix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+        job['status'] = 'completed'
+    except Exception as e:
+        logger.error(f"Job {job['job_id']} failed: {str(e)}", exc_info=True)
+        job['status'] = 'failed'
+        job['message'] = str(e)
+    # A verify job also looks ids up through status_controller, so every
+    # endpoint gives up the job's share
+    for used in (send_controller, status_controller):
+        used.leave(job['job_id'])
+    job['timings'] = timings.as_dict()
+    save_job_state(job)
+
+class StatusSummary:
+    """Status counts grouped by state, device type and requester, built per batch"""
+
+    # Report label -> legacy status_counts bucket
+    COUNT_KEYS = {
+        "Completed": "completed",
+        "Pending": "pending",
+        "Sent": "sent",
+        "Acknowledged": "acknowledged",
+        "Failed": "failed",
+        "Not Found": "not_found",
+        "Skipped": "skipped"
+    }
+
+    def __init__(self):
+        self.status_counts = dict.fromkeys(self.COUNT_KEYS.values(), 0)
+        self.by_state = {}
+        self.by_device_type = {}
+        self.by_requester = {}
+
+    def add(self, batch):
+        """Count a RowBatch or StatusCounts"""
+        for (status, device_type, requester), count in batch.summary_counts().items():
+            self.status_counts[self.COUNT_KEYS.get(status, "failed")] += count
+            self.by_state[status] = self.by_state.get(status, 0) + count
+            for groups, key in ((self.by_device_type, device_type), (self.by_requester, requester)):
+                counts = groups.setdefault(key, {})
+                counts[status] = counts.get(status, 0) + count
+
+    def as_dict(self):
+        return {
+            'status_counts': self.status_counts,
+            'by_state': self.by_state,
+            'by_device_type': self.by_device_type,
+            'by_requester': self.by_requester
+        }
+
+# Report columns holding epoch seconds, formatted as dates only when written
+EPOCH_COLUMNS = frozenset({"Created", "Updated", "Timestamp", "Sent At"})
+
+class RowBatch:
+    """One batch of report rows, held as a list per column.
+
+    compact() makes equal values in a column share one object, so an IMEI
+    repeated over its commands, a status, device type or "N/A" is stored
+    once per batch, and keeps EPOCH_COLUMNS as float64 epoch arrays (NaN
+    when missing) until output_columns() formats them. A row costs a few
+    pointers instead of a dict of strings, which is what bulk checks and
+    watch runs hold in memory.
+    """
+
+    __slots__ = ('columns',)
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def compact(cls, columns):
+        compacted = {}
+        for name, values in columns.items():
+            if name in EPOCH_COLUMNS:
+                compacted[name] = pd.to_numeric(pd.Series(values, dtype=object),
+                                                errors='coerce').to_numpy(dtype=np.float64)
             else:
-                for imei in batch_imeis:
-                    status_counts["failed"] += 1
-                    results.append({
-                        "IMEI": imei,
-                        "Sent Command": "N/A",
-                        "Status": "Error",
-                        "Message": f"API Error: {response.status_code} - {response.text[:100]}",
-                        "Created": "N/A",
-                        "Updated": "N/A",
-                        "Requested By": "N/A",
-                        "Device Type": "N/A",
-                        "Bee Number": "N/A"
-                    })
-            
-            time.sleep(DELAY_BETWEEN_BATCHES)
-            
-        except Exception as e:
-            for imei in batch_imeis:
-                status_counts["failed"] += 1
-                results.append({
-                    "IMEI": imei,
-                    "Sent Command": "N/A",
-                    "Status": "Error",
-                    "Message": str(e),
-                    "Created": "N/A",
-                    "Updated": "N/A",
-                    "Requested By": "N/A",
-                    "Device Type": "N/A",
-                    "Bee Number": "N/A"
-                })
-    
-    output = io.BytesIO()
-    df = pd.DataFrame(results)
-    df.to_excel(output, index=False)
-    output.seek(0)
+                # Only strings are shared; other values keep their exact type
+                memo = {}
+                compacted[name] = [memo.setdefault(value, value) if type(value) is str else value
+                                   for value in values]
+        return cls(compacted)
+
+    @classmethod
+    def from_records(cls, records):
+        names = list(records[0]) if records else []
+        return cls.compact({name: [record[name] for record in records] for name in names})
+
+    @classmethod
+    def concat(cls, batches):
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls({})
+        columns = {}
+        for name in batches[0].columns:
+            parts = [batch.columns[name] for batch in batches]
+            if name in EPOCH_COLUMNS:
+                columns[name] = np.concatenate(parts)
+            else:
+                columns[name] = [value for part in parts for value in part]
+        return cls(columns)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), ()))
+
+    def column(self, name):
+        return self.columns[name]
+
+    def set_constant(self, name, value):
+        self.columns[name] = [value] * len(self)
+
+    def slice(self, start, stop):
+        return RowBatch({name: values[start:stop] for name, values in self.columns.items()})
+
+    def imei_count(self):
+        return len(set(self.columns['IMEI']))
+
+    def status_counts(self):
+        return Counter(self.columns['Status'])
+
+    def summary_counts(self):
+        """Row counts per (Status, Device Type, Requested By)"""
+        return Counter(zip(self.columns['Status'], self.columns['Device Type'], self.columns['Requested By']))
+
+    def output_columns(self):
+        """Column name -> output values, with epochs formatted as local dates"""
+        return {name: epochs_to_dates(pd.Series(values)).tolist() if name in EPOCH_COLUMNS else values
+                for name, values in self.columns.items()}
+
+class StatusCounts:
+    """A status batch reduced to row counts per (Status, Device Type,
+    Requested By), for summary-only checks that write no report"""
+
+    __slots__ = ('imeis', 'groups')
+
+    def __init__(self, imeis, groups):
+        self.imeis = imeis
+        self.groups = groups
+
+    def __len__(self):
+        return sum(self.groups.values())
+
+    def imei_count(self):
+        return self.imeis
+
+    def status_counts(self):
+        counts = Counter()
+        for (status, _, _), count in self.groups.items():
+            counts[status] += count
+        return counts
+
+    def summary_counts(self):
+        return self.groups
+
+class NullReportWriter:
+    """Stand-in for ReportWriter on summary-only jobs"""
+
+    def __enter__(self):
+        return self
+
+    def write_rows(self, batch):
+        pass
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+class ReportWriter:
+    """Write report rows to disk as each batch finishes.
+
+    xlsx uses openpyxl write-only mode; csv, csv.gz and ndjson are written
+    line by line. The header is taken from the first RowBatch written.
+    """
+
+    def __init__(self, path, report_format):
+        self.path = path
+        self.format = report_format
+        self.columns = None
+        self.handle = None
+        self.workbook = None
+        self.sheet = None
+        self.csv_writer = None
+
+    def __enter__(self):
+        if self.format == 'xlsx':
+            self.workbook = openpyxl.Workbook(write_only=True)
+            self.sheet = self.workbook.create_sheet()
+        elif self.format == 'csv.gz':
+            self.handle = gzip.open(self.path, 'wt', newline='', encoding='utf-8')
+        else:
+            self.handle = open(self.path, 'w', newline='', encoding='utf-8')
+        if self.format in ('csv', 'csv.gz'):
+            self.csv_writer = csv.writer(self.handle)
+        return self
+
+    def write_rows(self, batch):
+        if not len(batch):
+            return
+        output = batch.output_columns()
+        if self.columns is None:
+            self.columns = list(output)
+            self.write_header()
+        rows = zip(*(output[col] for col in self.columns))
+        if self.format == 'ndjson':
+            for values in rows:
+                self.handle.write(json.dumps(dict(zip(self.columns, values))) + '\n')
+        elif self.sheet is not None:
+            for values in rows:
+                self.sheet.append(values)
+        else:
+            self.csv_writer.writerows(rows)
+
+    def write_header(self):
+        if self.sheet is not None:
+            self.sheet.append(self.columns)
+        elif self.csv_writer is not None:
+            self.csv_writer.writerow(self.columns)
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.workbook is not None:
+            self.workbook.save(self.path)
+        if self.handle is not None:
+            self.handle.close()
+        return False
+
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+def job_progress(job_id):
+    job = load_job_state(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@bp.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events stream of job progress.
+
+    The stream closes after JOB_EVENT_MAX_SECONDS; EventSource clients
+    reconnect after the advertised retry delay and get the current state.
+    """
+    if not load_job_state(job_id):
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def stream():
+        last_update = None
+        deadline = time.monotonic() + JOB_EVENT_MAX_SECONDS
+        yield f"retry: {int(JOB_EVENT_INTERVAL * 1000)}\n\n"
+        while True:
+            job = load_job_state(job_id)
+            if not job:
+                break
+            if job['updated'] != last_update:
+                last_update = job['updated']
+                yield f"data: {json.dumps(job)}\n\n"
+            if job['status'] != 'running' or time.monotonic() >= deadline:
+                break
+            time.sleep(JOB_EVENT_INTERVAL)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/api/jobs/<job_id>/summary', methods=['GET'])
+def job_summary(job_id):
+    """JSON aggregates of a status check, partial while it is still running"""
+    job = load_job_state(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.get('summary') is None:
+        return jsonify({'error': 'Job has no summary'}), 404
+    
+    return jsonify({
+        'job_id': job_id,
+        'status': job['status'],
+        'imeis_processed': job['imeis_processed'],
+        'total_imeis': job['total_imeis'],
+        **job['summary']
+    })
+
+@bp.route('/api/jobs/<job_id>/download', methods=['GET'])
+def job_download(job_id):
+    job = load_job_state(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] != 'completed':
+        return jsonify({'error': f"Job is {job['status']}"}), 409
+    if not job['report_file']:
+        return jsonify({'error': 'Summary-only job has no report'}), 404
     
     return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        os.path.join(TEMP_UPLOAD_DIR, job['report_file']),
+        mimetype=REPORT_FORMATS[job['format']][1],
         as_attachment=True,
-        download_name=f'status_results_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+        download_name=job['download_name']
     )
 
-def extract_at_command(msg, device_type=None):
-    if not msg or msg == "N/A":
-        return "N/A"
-    
-    if device_type in ["BSFlex", "BSMax", "BeeLabel", "BeeAssetFit"]:
+@lru_cache(maxsize=65536)
+def extract_at_command(msg):
+    """Decode the AT command from a hex device payload; memoized per message"""
+    try:
+        if len(msg) < 43:
+            return "No AT command found"
+        
+        command_hex = msg[38:-4]
+        if len(command_hex) % 2 != 0:
+            command_hex = command_hex[:-1]
+        
         try:
-            if len(msg) < 43:
-                return "No AT command found"
-            
-            command_hex = msg[38:-4]
-            if len(command_hex) % 2 != 0:
-                command_hex = command_hex[:-1]
-            
+            decoded = bytes.fromhex(command_hex).decode('ascii')
+            if decoded.startswith(("AT+", "at+")) or '=' in decoded:
+                return decoded
+            return command_hex
+        except:
+            return command_hex
+    except Exception as e:
+        return f"Parse error: {str(e)}"
+
+@bp.route('/clear_imeis', methods=['POST'])
+def clear_imeis():
+    # Parsed uploads are shared by content with other sessions, so only the
+    # reference is dropped; the sweeper removes the files once unused
+    session.pop('imei_upload_id', None)
+    session.pop('imei_upload_filename', None)
+    return jsonify({'success': True})
+
+def sweep_temp_files():
+    """Evict temp and journal entries by TTL, then least recently used over the size budget, and prune the index"""
+    entries = {}
+    for directory in (TEMP_UPLOAD_DIR, SEND_JOURNAL_DIR):
+        for entry in os.scandir(directory):
             try:
-                decoded = bytes.fromhex(command_hex).decode('ascii')
-                if decoded.startswith(("AT+", "at+")) or '=' in decoded:
-                    return decoded
-                return command_hex
-            except:
-                return command_hex
-        except Exception as e:
-            return f"Parse error: {str(e)}"
-    return msg
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            key = (directory, entry.name.split('.', 1)[0])
+            paths, size, used = entries.get(key, ([], 0, 0.0))
+            paths.append(entry.path)
+            entries[key] = (paths, size + stat.st_size, max(used, stat.st_mtime))
+    
+    now = time.time()
+    total = sum(size for _, size, _ in entries.values())
+    for (directory, key), (paths, size, used) in sorted(entries.items(), key=lambda item: item[1][2]):
+        if now - used > TEMP_FILE_TTL_SECONDS:
+            reason = 'ttl'
+        elif total > TEMP_DIR_MAX_BYTES and now - used > JOB_STALE_SECONDS:
+            reason = 'size'
+        else:
+            continue
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        kind = 'journal' if directory == SEND_JOURNAL_DIR else 'temp'
+        if kind == 'temp':
+            evict_imei_list(key)
+        total -= size
+        metrics.inc('roambee_temp_evictions_total', reason=reason, kind=kind)
+        logger.info(f"Evicted {kind} entry {key} ({size} bytes, {reason})")
+    
+    if command_index is not None:
+        expired, over_budget = command_index.prune(now - COMMAND_INDEX_TTL_SECONDS, COMMAND_INDEX_MAX_BYTES,
+                                                   now - JOB_STALE_SECONDS)
+        for reason, count in (('ttl', expired), ('size', over_budget)):
+            if count:
+                metrics.inc('roambee_index_pruned_imeis_total', count, reason=reason)
+                logger.info(f"Pruned {count} IMEIs from the command index ({reason})")
 
-def epoch_to_date(epoch):
-    if epoch is None:
-        return "N/A"
-    try:
-        return datetime.fromtimestamp(epoch).strftime("%Y-%m-%d %H:%M:%S")
-    except:
-        return "N/A"
+_sweeper_pid = None
+_sweeper_lock = threading.Lock()
 
-def get_requester(item):
-    if "request_by__first_name" in item and "request_by__last_name" in item:
-        return f"{item['request_by__first_name']} {item['request_by__last_name']}"
-    elif "request_by" in item:
-        return str(item["request_by"])
-    return "Unknown"
+@bp.before_app_request
+def start_temp_sweeper():
+    """Start this process's sweeper thread once.
 
-@app.route('/clear_imeis', methods=['POST'])
-def clear_imeis():
-    upload_id = session.pop('imei_upload_id', None)
-    if upload_id:
-        temp_path = os.path.join(TEMP_UPLOAD_DIR, f'{upload_id}.json')
+    Called per request rather than at import, so every forked gunicorn
+    worker gets its own thread.
+    """
+    global _sweeper_pid
+    with _sweeper_lock:
+        if _sweeper_pid == os.getpid():
+            return
+        _sweeper_pid = os.getpid()
+    threading.Thread(target=run_temp_sweeper, daemon=True).start()
+
+def run_temp_sweeper():
+    while True:
         try:
-            os.unlink(temp_path)
-        except:
-            pass
-    return jsonify({'success': True})
+            sweep_temp_files()
+        except Exception as e:
+            logger.error(f"Temp file sweep failed: {str(e)}", exc_info=True)
+        time.sleep(TEMP_SWEEP_INTERVAL)
+
+def reset_after_fork():
+    """Drop per-process handles inherited from the parent; each is reopened on first use"""
+    global _http_session, _http_session_lock, _page_executor, _page_executor_lock
+    _http_session = None
+    _http_session_lock = threading.Lock()
+    _page_executor = None
+    _page_executor_lock = threading.Lock()
+    for controller in (send_controller, status_controller):
+        for key in controller.keys:
+            if isinstance(key.limiter, SharedRateLimiter):
+                key.limiter.local = threading.local()
+    if command_index is not None:
+        command_index.local = threading.local()
+
+os.register_at_fork(after_in_child=reset_after_fork)
+
+def create_app():
+    """Build the app and its temp directories; safe to call in the gunicorn master"""
+    os.makedirs(TEMP_UPLOAD_DIR, exist_ok=True)
+    os.makedirs(SEND_JOURNAL_DIR, exist_ok=True)
+    flask_app = Flask(__name__)
+    flask_app.secret_key = 'your-secret-key-here'
+    flask_app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=1)
+    flask_app.register_blueprint(bp)
+    return flask_app
+
+_default_app = None
+_default_app_lock = threading.Lock()
+
+def __getattr__(name):
+    """`app` is built by create_app() on first access, for `gunicorn app:app` and scripts"""
+    global _default_app
+    if name != 'app':
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    with _default_app_lock:
+        if _default_app is None:
+            _default_app = create_app()
+        return _default_app
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    create_app().run(debug=True, port=5001)
\ No newline at end of file
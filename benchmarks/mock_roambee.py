@@ -0,0 +1,249 @@
+"""Local stand-in for the Roambee API used by the benchmark suite.
+
+Serves the two endpoints app.py talks to:
+
+    POST /services/command/send_commands
+    GET  /services/v2/autocrud/bee_commands?rbql=...
+
+bee_commands rows are generated deterministically per IMEI and honour the
+imei/created_date/updated_date/state filters, pagination, and the bees and
+users join fields. Commands accepted by send_commands get ids that can be
+looked up with an id filter; they read as Sent until delivery_seconds
+have passed, then Completed (every tenth Failed). Latency and 429/5xx
+injection are configurable, as are a per-API-key request quota (429 when
+exceeded) and revoked keys (401).
+
+Run standalone with:
+
+    python benchmarks/mock_roambee.py --port 8099 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+SEND_PATH = '/services/command/send_commands'
+STATUS_PATH = '/services/v2/autocrud/bee_commands'
+DEVICE_TYPES = ['BSFlex', 'BSMax', 'BeeLabel', 'BeeAssetFit', 'BeeSense']
+# Commands per IMEI are spread back from this epoch
+BASE_EPOCH = 1700000000
+
+
+class MockConfig:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, commands_per_imei=3,
+                 command_spacing=3600, seed=0, delivery_seconds=1.0, key_rate=None, revoked_keys=()):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.commands_per_imei = commands_per_imei
+        self.command_spacing = command_spacing
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.delivery_seconds = delivery_seconds
+        self.key_rate = key_rate
+        self.revoked_keys = set(revoked_keys)
+        self.counts = {'send': 0, 'status': 0, 'errors': 0}
+        self.key_counts = {}
+        # Per-key token buckets: key -> (tokens, updated)
+        self.key_tokens = {}
+        self.sent = {}
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def admit_key(self, key):
+        """Count a request against its key's quota; False when over it"""
+        with self.lock:
+            self.key_counts[key] = self.key_counts.get(key, 0) + 1
+            if not self.key_rate:
+                return True
+            now = time.monotonic()
+            tokens, updated = self.key_tokens.get(key, (1.0, now))
+            tokens = min(1.0, tokens + (now - updated) * self.key_rate)
+            admitted = tokens >= 1
+            self.key_tokens[key] = (tokens - admitted, now)
+            return admitted
+
+    def should_fail(self):
+        with self.lock:
+            return self.error_rate and self.random.random() < self.error_rate
+
+    def record_send(self, imeis, commands):
+        """Store one row per IMEI and command; returns the new ids"""
+        now = int(time.time())
+        ids = []
+        with self.lock:
+            for imei in imeis:
+                for command in commands:
+                    command_id = 10 ** 10 + len(self.sent)
+                    self.sent[command_id] = (time.time(), {'id': command_id, 'imei': imei, 'msg': command,
+                                                           'created_date': now})
+                    ids.append(command_id)
+        return ids
+
+    def sent_rows(self, ids):
+        now = time.time()
+        rows = []
+        for command_id in ids:
+            if command_id not in self.sent:
+                continue
+            sent_at, row = self.sent[command_id]
+            delivered = now - sent_at >= self.delivery_seconds
+            state = (4 if command_id % 10 == 0 else 3) if delivered else 1
+            rows.append({**row, 'state': state,
+                         'error_message': 'Device rejected command' if state == 4 else '',
+                         'updated_date': int(now) if delivered else row['created_date']})
+        return rows
+
+
+def hex_command(command):
+    """Device payload in the layout app.extract_at_command expects"""
+    return '00' * 19 + command.encode('ascii').hex() + 'ffff'
+
+
+def command_rows(imei, config):
+    seed = zlib.crc32(imei.encode())
+    device_type = DEVICE_TYPES[seed % len(DEVICE_TYPES)]
+    rows = []
+    for k in range(config.commands_per_imei):
+        created = BASE_EPOCH - k * config.command_spacing
+        command = f'AT+GPSINT={60 * (k + 1)}'
+        rows.append({
+            'id': seed * 100 + k,
+            'imei': imei,
+            'state': (seed + k) % 6,
+            'msg': hex_command(command) if device_type != 'BeeSense' else command,
+            'error_message': '' if (seed + k) % 6 != 4 else 'Device rejected command',
+            'created_date': created,
+            'updated_date': created + 120,
+            'request_by': 1000 + seed % 7,
+            'request_by__first_name': f'User{seed % 7}',
+            'request_by__last_name': 'Bench',
+            'bees__device_type': device_type,
+            'bees__bee_number': f'BEE-{imei[-6:]}',
+            'bees__uuid': f'uuid-{seed:x}'
+        })
+    return rows
+
+
+def matches(row, filters):
+    for f in filters:
+        value = row.get(f['name'])
+        op = f.get('op', 'eq')
+        if 'isNull' in f:
+            if (value is None) != f['isNull']:
+                return False
+        elif op == 'in' and value not in f['values']:
+            return False
+        elif op == 'ne' and 'values' in f and value in f['values']:
+            return False
+        elif op == 'ne' and 'value' in f and value == f['value']:
+            return False
+        elif op == 'gte' and not (value is not None and value >= f['value']):
+            return False
+        elif op == 'lte' and not (value is not None and value <= f['value']):
+            return False
+    return True
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def respond(self, code, body):
+            payload = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def simulate(self):
+            key = self.headers.get('apikey')
+            if key in config.revoked_keys:
+                self.respond(401, {'error': 'invalid api key'})
+                return False
+            if not config.admit_key(key):
+                config.count('errors')
+                self.respond(429, {'error': 'rate limit exceeded'})
+                return False
+            if config.latency or config.jitter:
+                time.sleep(config.latency + config.jitter * config.random.random())
+            if config.should_fail():
+                config.count('errors')
+                code = config.random.choice([429, 500, 502, 503])
+                self.respond(code, {'error': 'injected failure'})
+                return False
+            return True
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            if urlparse(self.path).path != SEND_PATH:
+                return self.respond(404, {'error': 'not found'})
+            config.count('send')
+            if not self.simulate():
+                return
+            data = json.loads(body.get('data', '{}'))
+            self.respond(200, {'ids': config.record_send(data.get('imeis', []), data.get('commands', []))})
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            if parsed.path != STATUS_PATH:
+                return self.respond(404, {'error': 'not found'})
+            config.count('status')
+            if not self.simulate():
+                return
+            rbql = json.loads(parse_qs(parsed.query)['rbql'][0])
+            filters = rbql.get('filters', [])
+            imeis = next((f['values'] for f in filters if f['name'] == 'imei' and f.get('op') == 'in'), [])
+            ids = next((f['values'] for f in filters if f['name'] == 'id' and f.get('op') == 'in'), None)
+            rows = []
+            if ids is not None:
+                rows.extend(row for row in config.sent_rows(ids) if matches(row, filters))
+            for imei in imeis or []:
+                rows.extend(row for row in command_rows(imei, config) if matches(row, filters))
+            rows.sort(key=lambda row: row['created_date'], reverse=True)
+            page = rbql.get('pagination', {'page_size': 500, 'page_num': 1})
+            start = (page['page_num'] - 1) * page['page_size']
+            self.respond(200, {'total': len(rows), 'data': rows[start:start + page['page_size']]})
+
+    return Handler
+
+
+def start(config=None, port=0):
+    """Start the mock server on a daemon thread; returns (base_url, server)"""
+    config = config or MockConfig()
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(config))
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.05, help='base seconds per request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random seconds per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction answered with 429/5xx')
+    parser.add_argument('--commands-per-imei', type=int, default=3)
+    args = parser.parse_args()
+    base_url, server = start(MockConfig(args.latency, args.jitter, args.error_rate, args.commands_per_imei),
+                             args.port)
+    print(f'Mock Roambee API on {base_url}')
+    print(f'  SEND_URL={base_url}{SEND_PATH}')
+    print(f'  STATUS_BASE_URL={base_url}{STATUS_PATH}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
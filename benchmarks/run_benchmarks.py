@@ -0,0 +1,182 @@
+"""Offline throughput benchmarks for upload_file, send_command and check_status.
+
+Every scenario runs in its own subprocess so peak RSS is measured per
+scenario. app.py is driven through the Flask test client against the local
+mock API in mock_roambee.py, so nothing touches view.roambee.com.
+
+    python benchmarks/run_benchmarks.py                      # 1k and 50k IMEIs
+    python benchmarks/run_benchmarks.py --sizes 1000,50000,500000
+    python benchmarks/run_benchmarks.py --scenarios status-bulk,status-latest --latency 0.1 --error-rate 0.02
+
+Each scenario prints one line with wall time, requests per second against
+the mock, peak RSS and report generation time. --json writes the raw results
+so runs can be compared for regressions.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ['upload-csv', 'upload-xlsx', 'send', 'send-verify', 'status-bulk', 'status-latest']
+
+
+def make_imeis(count):
+    return [str(350000000000000 + i) for i in range(count)]
+
+
+def write_upload(path, imeis, extension):
+    import pandas as pd
+    frame = pd.DataFrame({'Asset Name': [f'asset-{i}' for i in range(len(imeis))],
+                          'Device IMEI': imeis,
+                          'Site': 'bench'})
+    if extension == 'csv':
+        frame.to_csv(path, index=False)
+    else:
+        frame.to_excel(path, index=False)
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def wait_for_job(app, job_id, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = app.load_job_state(job_id)
+        if job and job['status'] != 'running':
+            return job
+        time.sleep(0.05)
+    raise TimeoutError(f'Job {job_id} did not finish in {timeout}s')
+
+
+def run_scenario(scenario, size, args):
+    """Run one scenario in this process and return its measurements"""
+    # Isolate the app's on-disk state from any real deployment
+    workdir = tempfile.mkdtemp(prefix='roambee_bench_')
+    os.environ['COMMAND_INDEX_PATH'] = os.path.join(workdir, 'index.sqlite3')
+    os.environ['SEND_JOURNAL_DIR'] = os.path.join(workdir, 'journals')
+    os.environ['RATE_LIMIT_DB_PATH'] = os.path.join(workdir, 'rate_limits.sqlite3')
+    os.environ['VERIFY_DELAY'] = str(args.delivery_seconds)
+    sys.path.insert(0, os.path.dirname(BENCH_DIR))
+    sys.path.insert(0, BENCH_DIR)
+    import logging
+    import mock_roambee
+    import app
+
+    logging.getLogger('app').setLevel(logging.WARNING)
+    config = mock_roambee.MockConfig(args.latency, args.jitter, args.error_rate, args.commands_per_imei,
+                                     delivery_seconds=args.delivery_seconds)
+    base_url, server = mock_roambee.start(config)
+    app.SEND_URL = base_url + mock_roambee.SEND_PATH
+    app.STATUS_BASE_URL = base_url + mock_roambee.STATUS_PATH
+    for controller in (app.send_controller, app.status_controller):
+        controller.set_rate(args.rate)
+
+    client = app.app.test_client()
+    imeis = make_imeis(size)
+    extension = 'xlsx' if scenario == 'upload-xlsx' else 'csv'
+    upload_path = os.path.join(workdir, f'fleet.{extension}')
+    write_upload(upload_path, imeis, extension)
+
+    started = time.perf_counter()
+    with open(upload_path, 'rb') as f:
+        response = client.post('/upload', data={'file': (f, f'fleet.{extension}')},
+                               content_type='multipart/form-data')
+    upload_seconds = time.perf_counter() - started
+    if response.status_code != 200:
+        raise RuntimeError(f'Upload failed: {response.get_json()}')
+
+    result = {'scenario': scenario, 'imeis': size, 'upload_seconds': round(upload_seconds, 3)}
+    if scenario.startswith('upload'):
+        result['wall_seconds'] = result['upload_seconds']
+    else:
+        if scenario.startswith('send'):
+            body = {'command': 'AT+GPSINT=60', 'format': args.format, 'verify': scenario == 'send-verify'}
+            path = '/api/send_command'
+        else:
+            body = {'start_date': '2023-01-01 00:00:00', 'end_date': '2024-12-31 23:59:59',
+                    'bulk_check': scenario == 'status-bulk', 'format': args.format}
+            path = '/api/check_status'
+        started = time.perf_counter()
+        response = client.post(path, json=body)
+        if response.status_code != 202:
+            raise RuntimeError(f'{path} failed: {response.get_json()}')
+        job = wait_for_job(app, response.get_json()['job_id'], args.timeout)
+        wall_seconds = time.perf_counter() - started
+        requests_made = config.counts['send'] + config.counts['status']
+        result.update({
+            'wall_seconds': round(wall_seconds, 3),
+            'job_status': job['status'],
+            'requests': requests_made,
+            'injected_errors': config.counts['errors'],
+            'requests_per_second': round(requests_made / wall_seconds, 2),
+            'imeis_per_second': round(size / wall_seconds, 1),
+            'report_seconds': job.get('report_seconds'),
+            'timings': job.get('timings'),
+            'final_batch_size': job.get('batch_size'),
+            'final_request_rate': job.get('request_rate')
+        })
+    server.shutdown()
+    result['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    return result
+
+
+def format_result(result):
+    parts = [f"{result['scenario']:<14}", f"{result['imeis']:>8} IMEIs", f"wall {result['wall_seconds']:>8.2f}s"]
+    if 'requests_per_second' in result:
+        parts.append(f"{result['requests_per_second']:>7.1f} req/s")
+        parts.append(f"report {result['report_seconds'] or 0:>6.2f}s")
+    parts.append(f"peak RSS {result['peak_rss_mb']:>7.1f} MB")
+    return '  '.join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--sizes', default='1000,50000', help='comma-separated IMEI counts')
+    parser.add_argument('--latency', type=float, default=0.02, help='mock seconds per request')
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of 429/5xx responses')
+    parser.add_argument('--commands-per-imei', type=int, default=3)
+    parser.add_argument('--rate', type=float, default=50, help='starting request rate per endpoint')
+    parser.add_argument('--delivery-seconds', type=float, default=1.0,
+                        help='seconds before a sent command reads as delivered; also the verify delay')
+    parser.add_argument('--format', default='xlsx', help='report format for send and status runs')
+    parser.add_argument('--timeout', type=float, default=3600)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--single', nargs=2, metavar=('SCENARIO', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_scenario(args.single[0], int(args.single[1]), args)))
+        return
+
+    forwarded = ['--latency', str(args.latency), '--jitter', str(args.jitter),
+                 '--error-rate', str(args.error_rate), '--commands-per-imei', str(args.commands_per_imei),
+                 '--rate', str(args.rate), '--delivery-seconds', str(args.delivery_seconds),
+                 '--format', args.format, '--timeout', str(args.timeout)]
+    results = []
+    for size in [int(size) for size in args.sizes.split(',')]:
+        for scenario in args.scenarios.split(','):
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--single', scenario, str(size)] + forwarded,
+                capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f'{scenario} {size}: FAILED\n{completed.stderr[-2000:]}')
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(format_result(result), flush=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Worker cold-start check for app.py.
+
+Times `import app; app.create_app()` in fresh interpreters, the work every
+gunicorn worker boot repeats without --preload, against a bare
+`import flask` baseline measured the same way. Fails when the median
+overhead over Flask exceeds the budget, when pandas, numpy, openpyxl or
+requests were imported at startup rather than on first use, or when a bare
+`import app` created any file or directory (those belong in create_app()
+or on first use).
+
+    python benchmarks/startup_check.py
+    python benchmarks/startup_check.py --runs 15 --budget 0.1
+
+Target: at most 0.15s over the Flask import. With the heavy modules
+imported eagerly it was about 0.75s; loaded lazily it is about 0.03s.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+HEAVY_MODULES = ['pandas', 'numpy', 'openpyxl', 'requests']
+
+TIMED = """
+import json, sys, time
+started = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - started
+print(json.dumps({{'seconds': seconds, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def time_import(statement, env):
+    """Run one timed statement in a fresh interpreter; returns (seconds, heavy modules loaded)"""
+    completed = subprocess.run([sys.executable, '-c', TIMED.format(statement=statement, heavy=HEAVY_MODULES)],
+                               cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return result['seconds'], result['loaded']
+
+
+def import_side_effects():
+    """Paths created by a bare `import app` with every default path under an empty dir"""
+    workdir = tempfile.mkdtemp(prefix='roambee_import_')
+    env = dict(os.environ, TMPDIR=workdir,
+               COMMAND_INDEX_PATH=os.path.join(workdir, 'index.sqlite3'),
+               SEND_JOURNAL_DIR=os.path.join(workdir, 'journals'),
+               RATE_LIMIT_DB_PATH=os.path.join(workdir, 'rate_limits.sqlite3'))
+    time_import('import app', env)
+    return sorted(os.path.relpath(os.path.join(root, name), workdir)
+                  for root, dirs, files in os.walk(workdir) for name in dirs + files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--budget', type=float, default=0.15, help='allowed median seconds over import flask')
+    args = parser.parse_args()
+
+    # Keep the app's SQLite files out of any real deployment's paths
+    workdir = tempfile.mkdtemp(prefix='roambee_startup_')
+    env = dict(os.environ,
+               COMMAND_INDEX_PATH=os.path.join(workdir, 'index.sqlite3'),
+               SEND_JOURNAL_DIR=os.path.join(workdir, 'journals'),
+               RATE_LIMIT_DB_PATH=os.path.join(workdir, 'rate_limits.sqlite3'))
+    # The first run writes app.py's bytecode cache, like a deploy's first boot
+    time_import('import app', env)
+
+    flask_times, app_times, loaded = [], [], set()
+    for _ in range(args.runs):
+        flask_times.append(time_import('import flask', env)[0])
+        seconds, modules = time_import('import app; app.create_app()', env)
+        app_times.append(seconds)
+        loaded.update(modules)
+
+    flask_median = statistics.median(flask_times)
+    app_median = statistics.median(app_times)
+    overhead = app_median - flask_median
+    print(f'import flask          median {flask_median:.3f}s')
+    print(f'import app + factory  median {app_median:.3f}s  (+{overhead:.3f}s, budget {args.budget:.3f}s)')
+
+    failures = []
+    if overhead > args.budget:
+        failures.append(f'startup overhead {overhead:.3f}s is over the {args.budget:.3f}s budget')
+    if loaded:
+        failures.append(f'imported at startup instead of on first use: {", ".join(sorted(loaded))}')
+    created = import_side_effects()
+    if created:
+        failures.append(f'import app created: {", ".join(created)}')
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
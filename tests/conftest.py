@@ -0,0 +1,64 @@
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+
+# Every default path in app.py (uploads, journals, the command index and the
+# shared rate limits) sits under the temp dir, so point it at a scratch one
+# before app is imported
+tempfile.tempdir = tempfile.mkdtemp(prefix='roambee_tests_')
+
+import app as roambee_app  # noqa: E402
+import mock_roambee  # noqa: E402
+
+# Importing app creates no directories; the factory makes them
+flask_app = roambee_app.create_app()
+
+
+@pytest.fixture
+def app_module():
+    return roambee_app
+
+
+@pytest.fixture
+def client():
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def make_imeis():
+    """Factory for `count` distinct IMEIs"""
+    return lambda count: [str(350000000000000 + i) for i in range(count)]
+
+
+@pytest.fixture
+def wait_for_job():
+    """Wait for a job to leave the running state; returns its final state"""
+    def wait(job_id, timeout=60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = roambee_app.load_job_state(job_id)
+            if job['status'] != 'running':
+                return job
+            time.sleep(0.05)
+        raise TimeoutError(job_id)
+    return wait
+
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    """Local mock Roambee API with app.py pointed at it; yields its MockConfig"""
+    config = mock_roambee.MockConfig(latency=0.01)
+    base_url, server = mock_roambee.start(config)
+    monkeypatch.setattr(roambee_app, 'SEND_URL', base_url + mock_roambee.SEND_PATH)
+    monkeypatch.setattr(roambee_app, 'STATUS_BASE_URL', base_url + mock_roambee.STATUS_PATH)
+    yield config
+    server.shutdown()
+    server.server_close()
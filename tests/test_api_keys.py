@@ -0,0 +1,51 @@
+import pytest
+
+from mock_roambee import BASE_EPOCH
+
+
+@pytest.fixture
+def controller(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'API_KEYS', ['key-a', 'key-b'])
+    monkeypatch.setattr(app_module, 'RATE_LIMIT_DB_PATH', '')
+    return app_module.AdaptiveController('bee_commands', rate=50)
+
+
+def status_call(app_module, controller):
+    url = app_module.status_queries[False].url(['350000000000000'], 0, BASE_EPOCH, 1)
+    return controller.call('GET', url, headers=app_module.STATUS_HEADERS, timeout=10)
+
+
+def test_pick_key_prefers_the_least_loaded(controller):
+    key_a, key_b = controller.keys
+    key_a.in_flight = 2
+    assert controller.pick_key() is key_b
+    # Fewest calls in flight per unit of rate, so a faster key takes more
+    key_a.limiter.set_rate(500)
+    assert controller.pick_key() is key_a
+    key_a.transition('throttled')
+    assert controller.pick_key() is key_b
+
+
+def test_throttled_key_hands_the_call_to_another(app_module, controller, mock_api):
+    key_a, key_b = controller.keys
+    # Each key's quota admits one call; the bias sends both calls to key-a first
+    mock_api.key_rate = 0.001
+    key_b.in_flight = 5
+    assert status_call(app_module, controller).status_code == 200
+    assert status_call(app_module, controller).status_code == 200
+    assert mock_api.key_counts == {'key-a': 2, 'key-b': 1}
+    assert key_a.state == 'throttled'
+    assert key_b.state == 'active'
+
+
+def test_rejected_key_is_revoked(app_module, controller, mock_api):
+    key_a, key_b = controller.keys
+    mock_api.revoked_keys = {'key-a'}
+    key_b.in_flight = 5
+    assert status_call(app_module, controller).status_code == 200
+    assert key_a.state == 'revoked'
+    assert status_call(app_module, controller).status_code == 200
+    # Three requests: key-a's 401, then key-b twice
+    assert mock_api.counts['status'] == 3
+    assert mock_api.key_counts == {'key-b': 2}
+    assert controller.rate == key_b.rate
@@ -0,0 +1,79 @@
+import json
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+
+@pytest.fixture
+def breaker(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'BREAKER_OPEN_SECONDS', 0.05)
+    probes = []
+
+    def probe():
+        probes.append(time.time())
+        return len(probes) > 1
+
+    breaker = app_module.CircuitBreaker('test', probe)
+    breaker.probes = probes
+    return breaker
+
+
+def wait_for_state(breaker, state, timeout=5):
+    deadline = time.time() + timeout
+    while breaker.state != state and time.time() < deadline:
+        time.sleep(0.01)
+    return breaker.state
+
+
+def test_opens_on_error_rate(app_module, breaker):
+    for healthy in [True] * (app_module.BREAKER_MIN_CALLS - 5) + [False] * 4:
+        breaker.record(healthy)
+    assert breaker.state == 'closed'
+    breaker.record(False)
+    assert breaker.state == 'open'
+    with pytest.raises(app_module.CircuitOpenError):
+        breaker.check()
+
+
+def test_opens_on_consecutive_timeouts(app_module, breaker):
+    for _ in range(app_module.BREAKER_CONSECUTIVE_TIMEOUTS - 1):
+        breaker.record(False, timeout=True)
+    breaker.record(True)
+    for _ in range(app_module.BREAKER_CONSECUTIVE_TIMEOUTS - 1):
+        breaker.record(False, timeout=True)
+    assert breaker.state == 'closed'
+    breaker.record(False, timeout=True)
+    assert breaker.state == 'open'
+
+
+def test_probes_with_backoff_then_closes(app_module, breaker):
+    for _ in range(app_module.BREAKER_CONSECUTIVE_TIMEOUTS):
+        breaker.record(False, timeout=True)
+    # The first probe fails, the second succeeds after a doubled delay
+    assert wait_for_state(breaker, 'half_open') == 'half_open'
+    assert len(breaker.probes) == 2
+    breaker.check()
+    for _ in range(app_module.BREAKER_HALF_OPEN_SUCCESSES):
+        breaker.record(True)
+    assert breaker.state == 'closed'
+
+
+def test_half_open_failure_reopens(app_module, breaker):
+    for _ in range(app_module.BREAKER_CONSECUTIVE_TIMEOUTS):
+        breaker.record(False, timeout=True)
+    assert wait_for_state(breaker, 'half_open') == 'half_open'
+    breaker.record(False)
+    assert breaker.state == 'open'
+    assert breaker.open_seconds > app_module.BREAKER_OPEN_SECONDS
+
+
+def test_probe_asks_for_one_row(app_module, mock_api, monkeypatch):
+    urls = []
+    session = app_module.get_http_session()
+    original = session.get
+    monkeypatch.setattr(session, 'get', lambda url, **kwargs: urls.append(url) or original(url, **kwargs))
+
+    assert app_module.probe_api()
+    rbql = json.loads(parse_qs(urlparse(urls[0]).query)['rbql'][0])
+    assert rbql['pagination'] == {'page_size': 1, 'page_num': 1}
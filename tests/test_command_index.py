@@ -0,0 +1,50 @@
+import pytest
+
+from mock_roambee import BASE_EPOCH
+
+DAY = 24 * 3600
+
+
+@pytest.fixture
+def index(app_module, monkeypatch, tmp_path):
+    index = app_module.CommandIndex(str(tmp_path / 'index.sqlite3'))
+    monkeypatch.setattr(app_module, 'command_index', index)
+    return index
+
+
+def command_ids(rows):
+    return sorted(row['id'] for row in rows)
+
+
+def test_fragmented_coverage_costs_at_most_two_queries(app_module, index, mock_api, make_imeis):
+    imeis = make_imeis(200)
+    # Earlier checks over overlapping slices of the fleet and date ranges
+    for i in range(10):
+        app_module.indexed_status_rows(imeis[i * 20:i * 20 + 40], BASE_EPOCH - (i + 2) * DAY, BASE_EPOCH - i * 600)
+
+    before = mock_api.counts['status']
+    rows = app_module.indexed_status_rows(imeis, BASE_EPOCH - DAY, BASE_EPOCH)
+    assert mock_api.counts['status'] - before <= 2
+    assert command_ids(rows) == command_ids(app_module.fetch_status_rows(imeis, BASE_EPOCH - DAY, BASE_EPOCH))
+
+
+def test_indexed_and_new_imeis_in_one_batch(app_module, index, mock_api, make_imeis):
+    imeis = make_imeis(100)
+    app_module.indexed_status_rows(imeis[:60], BASE_EPOCH - 2 * DAY, BASE_EPOCH)
+
+    before = mock_api.counts['status']
+    rows = app_module.indexed_status_rows(imeis, BASE_EPOCH - DAY, BASE_EPOCH)
+    assert mock_api.counts['status'] - before == 2
+    assert command_ids(rows) == command_ids(app_module.fetch_status_rows(imeis, BASE_EPOCH - DAY, BASE_EPOCH))
+    # The wider window already synced for the first IMEIs is kept
+    assert index.coverage(imeis[:1])[imeis[0]][:2] == (BASE_EPOCH - 2 * DAY, BASE_EPOCH)
+    assert index.coverage(imeis[-1:])[imeis[-1]][:2] == (BASE_EPOCH - DAY, BASE_EPOCH)
+
+
+def test_extending_the_window_fetches_only_the_new_part(app_module, index, mock_api, make_imeis):
+    imeis = make_imeis(50)
+    app_module.indexed_status_rows(imeis, BASE_EPOCH - DAY, BASE_EPOCH)
+
+    rows = app_module.indexed_status_rows(imeis, BASE_EPOCH - 3 * DAY, BASE_EPOCH)
+    assert command_ids(rows) == command_ids(app_module.fetch_status_rows(imeis, BASE_EPOCH - 3 * DAY, BASE_EPOCH))
+    assert index.coverage(imeis)[imeis[0]][:2] == (BASE_EPOCH - 3 * DAY, BASE_EPOCH)
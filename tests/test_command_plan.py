@@ -0,0 +1,56 @@
+def test_pack_never_crosses_a_sequence_boundary(app_module, make_imeis):
+    imeis = make_imeis(10)
+    codes = [1, 0, 1, 0, 0, 2, 1, 0, 2, 0]
+    plan = app_module.CommandPlan(imeis, [['AT+A'], ['AT+B', 'AT+C'], ['AT+D']], codes)
+
+    # Grouped by sequence: five of code 0, three of code 1, two of code 2
+    assert plan.codes.tolist() == [0] * 5 + [1] * 3 + [2] * 2
+    assert plan.boundaries == [5, 8, 10]
+    assert plan.pack(plan.imeis, 0, 4) == 4
+    assert plan.pack(plan.imeis, 4, 4) == 5
+    assert plan.pack(plan.imeis, 5, 100) == 8
+    assert plan.pack(plan.imeis, 8, 1) == 9
+
+
+def test_batches_get_their_group_commands(app_module, make_imeis):
+    imeis = make_imeis(6)
+    plan = app_module.CommandPlan(imeis, [['AT+A'], ['AT+B', 'AT+C']], [0, 1, 0, 1, 1, 0])
+
+    position, batches = 0, []
+    while position < len(plan):
+        stop = plan.pack(plan.imeis, position, 2)
+        batches.append((plan.imeis[position:stop], plan.commands_for(plan.imeis[position:stop])))
+        position = stop
+    assert batches == [([imeis[0], imeis[2]], ['AT+A']),
+                       ([imeis[5]], ['AT+A']),
+                       ([imeis[1], imeis[3]], ['AT+B', 'AT+C']),
+                       ([imeis[4]], ['AT+B', 'AT+C'])]
+
+
+def test_single_sequence_plan(app_module):
+    imeis = ['350000000000001', '350000000000000']
+    plan = app_module.CommandPlan.single(imeis, ['AT+X'])
+
+    assert plan.imeis == imeis
+    assert plan.pack(plan.imeis, 0, 1000) == 2
+    assert plan.commands_for(imeis[1:]) == ['AT+X']
+
+
+def test_batch_count_cuts_each_group_separately(app_module, make_imeis):
+    plan = app_module.CommandPlan(make_imeis(300), [['AT+A'], ['AT+B'], ['AT+C']], [0, 1, 2] * 100)
+
+    assert plan.batch_count(0, 200) == 3
+    assert plan.batch_count(0, 60) == 6
+    assert plan.batch_count(150, 200) == 2
+    assert plan.batch_count(300, 200) == 0
+
+
+def test_send_job_counts_batches_per_group(app_module, mock_api, make_imeis, wait_for_job, monkeypatch):
+    monkeypatch.setattr(app_module.send_controller, 'batch_size', 200)
+    plan = app_module.CommandPlan(make_imeis(300), [['AT+A'], ['AT+B'], ['AT+C']], [0, 1, 2] * 100)
+
+    job = app_module.start_send_job(plan, 'csv')
+    assert job['total_batches'] == 3
+    job = wait_for_job(job['job_id'])
+    assert job['status'] == 'completed'
+    assert job['batches_done'] == job['total_batches'] == 3
@@ -0,0 +1,10 @@
+import pandas as pd
+
+
+def test_luhn_valid(app_module):
+    imeis = pd.Series(['490154203237518', '490154203237517', '356938035643809', '000000000000000'])
+    assert app_module.luhn_valid(imeis).tolist() == [True, False, True, True]
+
+
+def test_luhn_valid_empty(app_module):
+    assert app_module.luhn_valid(pd.Series([], dtype=object)).tolist() == []
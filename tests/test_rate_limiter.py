@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def limiter(app_module, tmp_path):
+    return app_module.SharedRateLimiter(str(tmp_path / 'rate_limits.sqlite3'), 'bee_commands', 20)
+
+
+def calls_as(app_module, limiter, owner, count, release=True):
+    token = app_module.current_job_id.set(owner)
+    try:
+        for _ in range(count):
+            limiter.acquire()
+            if release:
+                limiter.release()
+    finally:
+        app_module.current_job_id.reset(token)
+
+
+def test_idle_owner_does_not_take_a_share(app_module, limiter):
+    calls_as(app_module, limiter, 'job-b', 1)
+    time.sleep(0.1)
+    started = time.monotonic()
+    calls_as(app_module, limiter, 'job-a', 11)
+    # Ten slots at the full rate; splitting with the idle job would take twice that
+    assert time.monotonic() - started < 0.75
+
+
+def test_busy_owners_stay_within_the_rate(app_module, limiter):
+    finished = {}
+
+    def run(owner):
+        calls_as(app_module, limiter, owner, 10)
+        finished[owner] = time.monotonic()
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=run, args=(owner,)) for owner in ('job-a', 'job-b')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Twenty calls at 20/s, shared evenly so both jobs end together
+    assert max(finished.values()) - started >= 19 / 20 - 0.05
+    assert abs(finished['job-a'] - finished['job-b']) < 0.3
+
+
+def test_in_flight_cap_holds_calls_until_release(app_module, limiter, monkeypatch):
+    monkeypatch.setattr(app_module, 'MAX_IN_FLIGHT', 2)
+    calls_as(app_module, limiter, 'job-a', 2, release=False)
+    third = threading.Thread(target=calls_as, args=(app_module, limiter, 'job-a', 1, False))
+    third.start()
+    third.join(0.3)
+    assert third.is_alive()
+    token = app_module.current_job_id.set('job-a')
+    limiter.release()
+    app_module.current_job_id.reset(token)
+    third.join(1)
+    assert not third.is_alive()
+
+
+def test_stale_owner_share_is_reclaimed(app_module, limiter, monkeypatch):
+    monkeypatch.setattr(app_module, 'MAX_IN_FLIGHT', 2)
+    now = time.time()
+    limiter.connect().execute("INSERT INTO rate_shares VALUES (?, ?, ?, ?, ?)",
+                              ('bee_commands', 'dead-job', now + 100, 2,
+                               now - app_module.RATE_SHARE_STALE_SECONDS - 1))
+    started = time.monotonic()
+    calls_as(app_module, limiter, 'job-a', 3)
+    assert time.monotonic() - started < 0.5
+    owners = [owner for owner, in limiter.connect().execute("SELECT owner FROM rate_shares")]
+    assert owners == ['job-a']
@@ -0,0 +1,72 @@
+import json
+import os
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+
+def unsent_run(app, imeis):
+    """A finished send run whose journal has no accepted batch"""
+    run_id = str(uuid.uuid4())
+    app.SendJournal.create(run_id, app.CommandPlan.single(imeis, ['AT+GPSINT=60']))
+    app.save_job_state({'job_id': run_id, 'kind': 'send_command', 'run_id': run_id, 'status': 'completed',
+                        'format': 'csv', 'watch': None})
+    return run_id
+
+
+def sends_per_imei(mock_api):
+    return Counter(row['imei'] for _, row in mock_api.sent.values())
+
+
+def test_resume_sends_only_unaccepted_imeis(app_module, client, mock_api, make_imeis, wait_for_job):
+    imeis = make_imeis(600)
+    run_id = unsent_run(app_module, imeis)
+    journal = app_module.SendJournal(run_id)
+    journal.record(imeis[:200], 'Success', [], 'ok', 1)
+    journal.record(imeis[200:400], 'Error', [], 'HTTP 500', 3)
+
+    response = client.post(f'/api/jobs/{run_id}/resume')
+    assert response.status_code == 202
+    assert response.get_json()['remaining_imeis'] == 400
+    assert wait_for_job(response.get_json()['job_id'])['status'] == 'completed'
+    assert set(sends_per_imei(mock_api)) == set(imeis[200:])
+
+    response = client.post(f'/api/jobs/{run_id}/resume')
+    assert response.status_code == 200
+    assert response.get_json()['remaining_imeis'] == 0
+
+
+def test_concurrent_resumes_of_one_run_send_once(app_module, client, mock_api, make_imeis, wait_for_job):
+    imeis = make_imeis(2000)
+    run_id = unsent_run(app_module, imeis)
+
+    first = client.post(f'/api/jobs/{run_id}/resume')
+    second = client.post(f'/api/jobs/{run_id}/resume')
+    assert first.status_code == 202
+    assert second.status_code == 409
+    assert first.get_json()['job_id'] in second.get_json()['error']
+
+    assert wait_for_job(first.get_json()['job_id'])['status'] == 'completed'
+    counts = sends_per_imei(mock_api)
+    assert len(counts) == len(imeis)
+    assert set(counts.values()) == {1}
+
+
+def test_resume_takes_over_from_a_dead_worker(app_module, client, mock_api, make_imeis, wait_for_job):
+    imeis = make_imeis(50)
+    run_id = unsent_run(app_module, imeis)
+    # A job left 'running' by a worker that died, recorded as the run's sender
+    dead_id = str(uuid.uuid4())
+    app_module.save_job_state({'job_id': dead_id, 'kind': 'send_command', 'run_id': run_id, 'status': 'running'})
+    stale = app_module.load_job_state(dead_id)
+    stale['updated'] = datetime.fromtimestamp(time.time() - app_module.JOB_STALE_SECONDS - 1).isoformat()
+    with open(app_module.job_state_path(dead_id), 'w') as f:
+        json.dump(stale, f)
+    with open(os.path.join(app_module.SEND_JOURNAL_DIR, f'{run_id}.active'), 'w') as f:
+        f.write(dead_id)
+
+    response = client.post(f'/api/jobs/{run_id}/resume')
+    assert response.status_code == 202
+    assert wait_for_job(response.get_json()['job_id'])['status'] == 'completed'
+    assert set(sends_per_imei(mock_api)) == set(imeis)
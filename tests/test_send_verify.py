@@ -0,0 +1,17 @@
+import sqlite3
+
+
+def test_verify_job_gives_up_every_rate_share(app_module, mock_api, monkeypatch, make_imeis, wait_for_job):
+    monkeypatch.setattr(app_module, 'VERIFY_DELAY', 0.1)
+    mock_api.delivery_seconds = 0.1
+    imeis = make_imeis(300)
+
+    job = app_module.start_send_job(app_module.CommandPlan.single(imeis, ['AT+X']), 'csv', verify_timeout=30)
+    job = wait_for_job(job['job_id'])
+    assert job['status'] == 'completed'
+    assert job['watch']['outcome'] == 'converged'
+    assert mock_api.counts['status'] > 0
+
+    with sqlite3.connect(app_module.RATE_LIMIT_DB_PATH) as conn:
+        shares = conn.execute("SELECT endpoint FROM rate_shares WHERE owner = ?", (job['job_id'],)).fetchall()
+    assert shares == []
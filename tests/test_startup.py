@@ -0,0 +1,19 @@
+import json
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['pandas', 'numpy', 'openpyxl', 'requests']
+
+
+def test_import_loads_no_heavy_module_and_creates_no_files(tmp_path):
+    env = dict(os.environ, TMPDIR=str(tmp_path))
+    for name in ('COMMAND_INDEX_PATH', 'SEND_JOURNAL_DIR', 'RATE_LIMIT_DB_PATH'):
+        env.pop(name, None)
+    completed = subprocess.run(
+        [sys.executable, '-c', f'import json, sys, app; print(json.dumps([m for m in {HEAVY_MODULES!r} '
+                               f'if m in sys.modules]))'],
+        cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True)
+    assert json.loads(completed.stdout.strip().splitlines()[-1]) == []
+    assert os.listdir(tmp_path) == []
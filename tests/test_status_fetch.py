@@ -0,0 +1,50 @@
+from math import ceil
+
+import pytest
+
+from mock_roambee import BASE_EPOCH, command_rows
+
+COMMANDS = 60
+START = BASE_EPOCH - (COMMANDS - 1) * 3600
+
+
+@pytest.fixture
+def expected(make_imeis, mock_api):
+    """Rows the mock holds for 40 IMEIs over the window, newest first"""
+    mock_api.commands_per_imei = COMMANDS
+    imeis = make_imeis(40)
+    rows = [row for imei in imeis for row in command_rows(imei, mock_api) if row['state'] != 5]
+    rows.sort(key=lambda row: row['created_date'], reverse=True)
+    return imeis, rows
+
+
+def fetch(app_module, mock_api, imeis):
+    before = mock_api.counts['status']
+    rows = app_module.fetch_status_rows(imeis, START, BASE_EPOCH)
+    return rows, mock_api.counts['status'] - before
+
+
+def test_pages_cover_the_window(app_module, mock_api, expected, monkeypatch):
+    monkeypatch.setattr(app_module, 'STATUS_SHARD_SECONDS', 10 ** 9)
+    imeis, rows = expected
+    fetched, requests = fetch(app_module, mock_api, imeis)
+    assert len(rows) > 3 * app_module.STATUS_PAGE_SIZE
+    assert [row['id'] for row in fetched] == [row['id'] for row in rows]
+    assert requests == ceil(len(rows) / app_module.STATUS_PAGE_SIZE)
+
+
+def test_shards_cover_the_window_and_reuse_the_first_page(app_module, mock_api, expected, monkeypatch):
+    monkeypatch.setattr(app_module, 'STATUS_SHARD_SECONDS', 6 * 3600)
+    imeis, rows = expected
+    fetched, requests = fetch(app_module, mock_api, imeis)
+    assert sorted(row['id'] for row in fetched) == sorted(row['id'] for row in rows)
+    assert [row['created_date'] for row in fetched] == [row['created_date'] for row in rows]
+
+    # Only the part of the window older than the first page is sharded
+    page_size = app_module.STATUS_PAGE_SIZE
+    oldest = rows[page_size - 1]['created_date']
+    shards = app_module.time_shards(START, oldest, ceil(len(rows) / page_size) - 1)
+    assert len(shards) > 1
+    shard_pages = [max(1, ceil(sum(start <= row['created_date'] <= end for row in rows) / page_size))
+                   for start, end in shards]
+    assert requests == 1 + sum(shard_pages)
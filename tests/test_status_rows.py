@@ -0,0 +1,29 @@
+def report(app_module, commands, imeis=('350000000000000',)):
+    rows = app_module.build_status_rows(list(imeis), commands, True).output_columns()
+    return [dict(zip(rows, values)) for values in zip(*rows.values())]
+
+
+def test_null_payload_fields_print_as_the_per_row_code_did(app_module):
+    row, = report(app_module, [{
+        'id': 1, 'imei': '350000000000000', 'state': None, 'msg': None, 'error_message': None,
+        'created_date': None, 'updated_date': None, 'request_by': None,
+        'request_by__first_name': None, 'request_by__last_name': None,
+        'bees__device_type': None, 'bees__bee_number': None
+    }])
+    assert row == {'IMEI': '350000000000000', 'Sent Command': 'N/A', 'Status': 'Unknown state (None)',
+                   'Message': None, 'Created': 'N/A', 'Updated': 'N/A', 'Requested By': 'None None',
+                   'Device Type': None, 'Bee Number': None}
+
+
+def test_requested_by_falls_back_to_the_raw_id(app_module):
+    rows = report(app_module, [{'id': 1, 'imei': '350000000000000', 'state': 3, 'request_by': 1001},
+                               {'id': 2, 'imei': '350000000000000', 'state': 9, 'request_by': None}])
+    assert [row['Requested By'] for row in rows] == ['1001', 'None']
+    assert [row['Status'] for row in rows] == ['Completed', 'Unknown state (9)']
+
+
+def test_missing_fields_get_defaults(app_module):
+    rows = report(app_module, [{'id': 1, 'imei': '350000000000000'}], imeis=['350000000000000', '350000000000001'])
+    assert rows[0]['Status'] == 'Unknown state (-1)'
+    assert (rows[0]['Requested By'], rows[0]['Device Type'], rows[0]['Bee Number']) == ('Unknown', 'N/A', 'N/A')
+    assert rows[1]['Status'] == 'Not Found'
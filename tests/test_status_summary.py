@@ -0,0 +1,52 @@
+import pytest
+
+from mock_roambee import MockConfig, command_rows
+
+
+def payload(imeis):
+    """mock rows plus rows with missing, null and unusual fields, newest first"""
+    rows = [row for imei in imeis[:-1] for row in command_rows(imei, MockConfig())]
+    odd = imeis[0]
+    rows += [
+        {'id': 1, 'imei': odd, 'state': None, 'created_date': 10, 'request_by': None},
+        {'id': 2, 'imei': odd, 'state': 9, 'created_date': 9, 'bees__device_type': None, 'request_by': 7,
+         'request_by__first_name': None, 'request_by__last_name': 'Bench'},
+        {'id': 3, 'imei': odd, 'state': 5, 'created_date': 8, 'request_by': 7,
+         'request_by__first_name': 'Ann', 'request_by__last_name': 'Lee'},
+        {'id': 4, 'imei': '999999999999999', 'state': 3, 'created_date': 7},
+    ]
+    return rows
+
+
+@pytest.mark.parametrize('bulk_check', [True, False])
+def test_counts_match_report_rows(app_module, bulk_check, make_imeis):
+    imeis = make_imeis(40) + ['350000000000000']
+    commands = payload(imeis)
+
+    rows = app_module.build_status_rows(imeis, commands, bulk_check)
+    counts = app_module.count_status_rows(imeis, commands, bulk_check)
+    assert counts.imei_count() == rows.imei_count()
+    assert counts.status_counts() == rows.status_counts()
+    assert counts.summary_counts() == rows.summary_counts()
+    assert len(counts) == len(rows)
+
+
+def test_summary_mode_builds_no_rows(app_module, monkeypatch, make_imeis):
+    monkeypatch.setattr(app_module, 'indexed_status_rows', lambda imeis, *args: payload(imeis))
+    monkeypatch.setattr(app_module, 'build_status_rows', None)
+    imeis = make_imeis(10)
+
+    summary = app_module.StatusSummary()
+    summary.add(app_module.status_batch(imeis, 0, 1, True, summary=True))
+    assert sum(summary.as_dict()['status_counts'].values()) == 3 * 9 + 3 + 1
+
+
+def test_summary_mode_counts_failed_batches(app_module, monkeypatch, make_imeis):
+    def unavailable(*args):
+        raise app_module.StatusAPIError('HTTP 503')
+    monkeypatch.setattr(app_module, 'indexed_status_rows', unavailable)
+    imeis = make_imeis(10)
+
+    counts = app_module.status_batch(imeis, 0, 1, True, summary=True)
+    assert counts.imei_count() == 10
+    assert counts.summary_counts() == {('Error', 'N/A', 'N/A'): 10}
@@ -0,0 +1,57 @@
+import zlib
+
+import pytest
+
+from mock_roambee import BASE_EPOCH
+
+START = BASE_EPOCH - 10 * 3600
+
+
+def latest_is_terminal(imei):
+    """The mock's newest command for an IMEI has state crc32 % 6; 5 rows are filtered out"""
+    return zlib.crc32(imei.encode()) % 6 in (3, 4)
+
+
+@pytest.fixture
+def watch_job(app_module, mock_api, wait_for_job):
+    def run(imeis, timeout):
+        watch = app_module.StatusWatch(imeis, START, BASE_EPOCH, True, False, 0.1, timeout)
+        job = app_module.start_job('check_status', imeis, watch, app_module.status_controller, 'status_results',
+                                   'csv', summary=app_module.StatusSummary(), watch=watch)
+        return wait_for_job(job['job_id'])
+    return run
+
+
+def test_watch_converges_when_every_imei_is_terminal(watch_job, make_imeis):
+    imeis = [imei for imei in make_imeis(100) if latest_is_terminal(imei)]
+    job = watch_job(imeis, 30)
+    assert job['status'] == 'completed'
+    assert job['watch']['outcome'] == 'converged'
+    assert job['watch']['pending'] == 0
+    assert len(job['watch']['rounds']) == 1
+    assert job['imeis_processed'] == len(imeis)
+
+
+def test_watch_stops_at_the_deadline(watch_job, make_imeis):
+    imeis = make_imeis(30)
+    pending = sum(not latest_is_terminal(imei) for imei in imeis)
+    job = watch_job(imeis, 0.5)
+    assert job['status'] == 'completed'
+    assert job['watch']['outcome'] == 'deadline'
+    assert job['watch']['pending'] == pending
+    assert job['message'] == f'Deadline reached with {pending} IMEIs still pending'
+    assert job['imeis_processed'] == len(imeis)
+
+
+def test_first_round_reports_progress_per_batch(app_module, mock_api, make_imeis, monkeypatch):
+    monkeypatch.setattr(app_module.status_controller, 'batch_size', 50)
+    imeis = [imei for imei in make_imeis(400) if latest_is_terminal(imei)]
+    watch = app_module.StatusWatch(imeis, START, BASE_EPOCH, True, False, 0.1, 30)
+    progress = []
+    for batch in watch:
+        if watch.rounds:
+            break
+        progress.append(watch.polled)
+    assert len(progress) > 1
+    assert progress == sorted(progress)
+    assert progress[-1] == len(imeis)
@@ -0,0 +1,86 @@
+import os
+import time
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def dirs(app_module, monkeypatch, tmp_path):
+    uploads, journals = tmp_path / 'uploads', tmp_path / 'journals'
+    uploads.mkdir()
+    journals.mkdir()
+    monkeypatch.setattr(app_module, 'TEMP_UPLOAD_DIR', str(uploads))
+    monkeypatch.setattr(app_module, 'SEND_JOURNAL_DIR', str(journals))
+    monkeypatch.setattr(app_module, 'command_index', None)
+    return uploads, journals
+
+
+def send_run(app_module):
+    """A send run's journal, .active record and job state; returns the run id"""
+    run_id = str(uuid.uuid4())
+    app_module.SendJournal.create(run_id, app_module.CommandPlan.single(['350000000000000'], ['AT+X']))
+    open(os.path.join(app_module.SEND_JOURNAL_DIR, f'{run_id}.active'), 'w').close()
+    app_module.save_job_state({'job_id': run_id, 'kind': 'send_command', 'run_id': run_id, 'status': 'completed'})
+    return run_id
+
+
+def age(directory, seconds):
+    then = time.time() - seconds
+    for path in directory.iterdir():
+        os.utime(path, (then, then))
+
+
+def names(directory):
+    return {path.name.split('.', 1)[0] for path in directory.iterdir()}
+
+
+def test_journal_outlives_its_job_states(app_module, dirs):
+    uploads, journals = dirs
+    run_id = send_run(app_module)
+    age(journals, app_module.TEMP_FILE_TTL_SECONDS + 60)
+    # A resumed job of the run saves its state
+    resumed_id = str(uuid.uuid4())
+    app_module.save_job_state({'job_id': resumed_id, 'kind': 'send_command', 'run_id': run_id,
+                               'status': 'completed'})
+
+    app_module.sweep_temp_files()
+    assert names(journals) == {run_id}
+
+    age(uploads, app_module.TEMP_FILE_TTL_SECONDS + 60)
+    age(journals, app_module.TEMP_FILE_TTL_SECONDS + 60)
+    app_module.sweep_temp_files()
+    assert names(uploads) == set()
+    assert names(journals) == set()
+
+
+def test_journals_count_toward_the_size_budget(app_module, dirs, monkeypatch):
+    uploads, journals = dirs
+    send_run(app_module)
+    age(uploads, app_module.JOB_STALE_SECONDS + 60)
+    age(journals, app_module.JOB_STALE_SECONDS + 60)
+    new_run = send_run(app_module)
+    monkeypatch.setattr(app_module, 'TEMP_DIR_MAX_BYTES', 1)
+
+    app_module.sweep_temp_files()
+    # Everything past JOB_STALE_SECONDS goes; the run still in use stays
+    assert names(journals) == {new_run}
+    assert names(uploads) == {new_run}
+
+
+def test_index_prune(app_module, tmp_path, make_imeis):
+    index = app_module.CommandIndex(str(tmp_path / 'index.sqlite3'))
+    now = int(time.time())
+    imeis = make_imeis(30)
+    index.upsert([{'id': i, 'imei': imei, 'created_date': 100, 'msg': 'x' * 2000} for i, imei in enumerate(imeis)])
+    index.mark_synced(imeis[:10], 0, 200, now - 10 * 24 * 3600)
+    index.mark_synced(imeis[10:20], 0, 200, now - 3600)
+    index.mark_synced(imeis[20:], 0, 200, now)
+
+    assert index.prune(now - 7 * 24 * 3600, 10 ** 9, now - 300) == (10, 0)
+    assert set(index.coverage(imeis)) == set(imeis[10:])
+
+    # Over budget, only IMEIs synced before in_use_since can go
+    assert index.prune(now - 7 * 24 * 3600, 1, now - 300) == (0, 10)
+    assert set(index.coverage(imeis)) == set(imeis[20:])
+    assert len(index.query(imeis, 0, 200)) == 10